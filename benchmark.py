@@ -0,0 +1,190 @@
+"""
+  Benchmarks of logging, parsing, navigation and replay on synthetic logs
+  usage:
+     python benchmark.py [--duration SEC] [--output results.json] [--baseline old.json]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from logger import (LogWriter, BufferedLogWriter, LaneLogWriter, CompressedLogWriter, LogReader,
+                    MmapLogReader, LogEnd)
+from logparser import naio_packets
+from robot import Robot
+from myr2017 import laser2ascii, laser_sectors, free_gaps
+from play_video import play_video
+from replay import replay
+from synthlog import generate, laser_scan
+
+
+def measure(func, repeat):
+    "return (best time in seconds, number of operations)"
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        ops = func()
+        duration = time.perf_counter() - start
+        if best is None or duration < best:
+            best = duration
+    return best, ops
+
+
+def bench_write(log_class, count=20000, version=1):
+    data = bytes(1024)
+    def run():
+        with log_class(prefix='bench', version=version) as log:
+            for i in range(count):
+                log.write(1, data)
+        os.remove(log.filename)
+        return count
+    return run
+
+
+def bench_read(reader_class, filename):
+    def run():
+        count = 0
+        with reader_class(filename) as log:
+            try:
+                while True:
+                    log.read()
+                    count += 1
+            except LogEnd:
+                pass
+        return count
+    return run
+
+
+def bench_naio_packets(filename):
+    def run():
+        with LogReader(filename) as log:
+            return sum(1 for packet in naio_packets(log))
+    return run
+
+
+def bench_update_laser(count=20000):
+    data = laser_scan(random.Random(0), 0.0)
+    robot = Robot(None, None)
+    def run():
+        for i in range(count):
+            robot.update_laser(data)
+        return count
+    return run
+
+
+def bench_laser2ascii(count=5000):
+    robot = Robot(None, None)
+    robot.update_laser(laser_scan(random.Random(0), 0.0))
+    scan = robot.laser
+    def run():
+        for i in range(count):
+            laser2ascii(scan)
+            laser2ascii(scan, limit=1.5)
+        return count
+    return run
+
+
+def bench_free_gaps(count=5000):
+    robot = Robot(None, None)
+    robot.update_laser(laser_scan(random.Random(0), 0.0))
+    scan = robot.laser
+    def run():
+        for i in range(count):
+            free_gaps(laser_sectors(scan), [1.0, 1.5])
+        return count
+    return run
+
+
+def bench_replay(filename):
+    def run():
+        return replay(filename, force=True)['cycles']
+    return run
+
+
+def bench_play_video(filename, dirname):
+    def run():
+        cwd = os.getcwd()
+        os.chdir(dirname)
+        try:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                return play_video(os.path.join(cwd, filename))
+        finally:
+            os.chdir(cwd)
+    return run
+
+
+def run_benchmarks(duration=60.0, video_duration=5.0, repeat=3):
+    workdir = tempfile.mkdtemp(prefix='naio_bench')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        log_file = generate(prefix='synth', duration=duration)
+        video_file = generate(prefix='video', duration=video_duration, video_fps=10.0)
+        images_dir = tempfile.mkdtemp(dir=workdir)
+        benchmarks = [
+            ('LogWriter.write', bench_write(LogWriter)),
+            ('BufferedLogWriter.write', bench_write(BufferedLogWriter)),
+            ('LaneLogWriter.write', bench_write(LaneLogWriter)),
+            ('CompressedLogWriter.write', bench_write(CompressedLogWriter, version=2)),
+            ('LogReader.read', bench_read(LogReader, log_file)),
+            ('MmapLogReader.read', bench_read(MmapLogReader, log_file)),
+            ('naio_packets', bench_naio_packets(log_file)),
+            ('Robot.update_laser', bench_update_laser()),
+            ('laser2ascii', bench_laser2ascii()),
+            ('free_gaps', bench_free_gaps()),
+            ('replay', bench_replay(log_file)),
+            ('play_video', bench_play_video(video_file, images_dir)),
+        ]
+        results = {}
+        for name, func in benchmarks:
+            seconds, ops = measure(func, repeat)
+            results[name] = {'seconds': seconds, 'ops': ops, 'ops_per_sec': ops / seconds}
+            print('%-26s %10.4fs %12.0f ops/s' % (name, seconds, ops / seconds))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+    return {
+        'meta': {'python': sys.version.split()[0], 'platform': platform.platform(),
+                 'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'duration': duration,
+                 'repeat': repeat},
+        'results': results,
+    }
+
+
+def compare(results, baseline):
+    "print speedup against baseline results"
+    for name, value in sorted(results['results'].items()):
+        old = baseline['results'].get(name)
+        if old is None:
+            print('%-26s new' % name)
+        else:
+            print('%-26s %6.2fx' % (name, value['ops_per_sec'] / old['ops_per_sec']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run benchmarks on synthetic logs')
+    parser.add_argument('--duration', type=float, default=60.0, help='synthetic log duration in seconds')
+    parser.add_argument('--video-duration', dest='video_duration', type=float, default=5.0,
+                        help='synthetic video log duration in seconds')
+    parser.add_argument('--repeat', type=int, default=3, help='take the best of N runs')
+    parser.add_argument('--output', '-o', help='save results as JSON')
+    parser.add_argument('--baseline', help='compare with previously saved results')
+    args = parser.parse_args()
+
+    results = run_benchmarks(duration=args.duration, video_duration=args.video_duration,
+                             repeat=args.repeat)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+# vim: expandtab sw=4 ts=4
@@ -0,0 +1,105 @@
+"""
+  Video compression level adapted to backlog - shared by VideoRecorder
+  and AsyncTransport
+"""
+
+from naio import NAIO_MAGIC, HEADER_SIZE, WRAP_SIZE, MAX_FRAME_SIZE, SIZE_STRUCT
+
+
+class FrameCounter:
+    """
+    Count NAIO01 frames of video stream split into chunks, only the headers
+    are parsed. Frame belongs to the chunk with its header.
+    """
+    def __init__(self):
+        self.remaining = 0  # bytes of the current frame in the next chunks
+        self.header = bytearray()  # incomplete header at the end of previous chunk
+
+    def count(self, data):
+        "return number of frames starting in data"
+        num_frames = 0
+        size = len(data)
+        pos = self.remaining
+        while pos < size:
+            prefix = len(self.header)  # header bytes from previous chunk
+            self.header += data[pos:pos + HEADER_SIZE - prefix]
+            if len(self.header) < HEADER_SIZE:
+                pos = size
+                break
+            frame_size = SIZE_STRUCT.unpack_from(self.header, 7)[0]
+            if not self.header.startswith(NAIO_MAGIC) or frame_size > MAX_FRAME_SIZE:
+                # corrupted data - continue with the next magic
+                i = data.find(NAIO_MAGIC, pos + 1 if prefix == 0 else pos)
+                self.header.clear()
+                pos = size if i < 0 else i
+                continue
+            num_frames += 1
+            pos += frame_size + WRAP_SIZE - prefix
+            self.header.clear()
+        self.remaining = pos - size
+        return num_frames
+
+
+class AdaptiveCompression:
+    """
+    levels is list of (backlog limit, zlib level), chunks received with
+    backlog over the last limit are stored (level 0) so the receiver never
+    waits for the compression. Collects statistics of chunks and frames.
+    """
+    def __init__(self, levels):
+        self.levels = levels
+        self.frame_counter = FrameCounter()
+        self.chunks_received = 0
+        self.chunks_compressed = 0
+        self.chunks_stored = 0  # not compressed due to backlog
+        self.chunks_dropped = 0  # backlog over its limit
+        self.frames_received = 0
+        self.frames_compressed = 0
+        self.frames_stored = 0
+        self.frames_dropped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.max_backlog = 0
+
+    def level(self, backlog):
+        for max_backlog, level in self.levels:
+            if backlog < max_backlog:
+                return level
+        return 0
+
+    def received(self, data, backlog):
+        """
+        return (compression level, number of frames) of new chunk, backlog
+        is number of chunks waiting
+        """
+        self.max_backlog = max(self.max_backlog, backlog)
+        num_frames = self.frame_counter.count(data)
+        self.chunks_received += 1
+        self.frames_received += num_frames
+        self.bytes_in += len(data)
+        return self.level(backlog), num_frames
+
+    def written(self, data, level, num_frames):
+        "chunk compressed with level was logged"
+        if level == 0:
+            self.chunks_stored += 1
+            self.frames_stored += num_frames
+        else:
+            self.chunks_compressed += 1
+            self.frames_compressed += num_frames
+        self.bytes_out += len(data)
+
+    def dropped(self, num_frames):
+        self.chunks_dropped += 1
+        self.frames_dropped += num_frames
+
+    def stats(self, backlog):
+        return {'chunks_received': self.chunks_received, 'chunks_compressed': self.chunks_compressed,
+                'chunks_stored': self.chunks_stored, 'chunks_dropped': self.chunks_dropped,
+                'frames_received': self.frames_received,
+                'frames_compressed': self.frames_compressed,
+                'frames_stored': self.frames_stored, 'frames_dropped': self.frames_dropped,
+                'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out, 'backlog': backlog,
+                'max_backlog': self.max_backlog}
+
+# vim: expandtab sw=4 ts=4
@@ -0,0 +1,95 @@
+"""
+  Non-blocking diagnostic output of the control loop
+"""
+
+import sys
+import time
+from collections import OrderedDict
+from threading import Condition, Thread
+
+
+def print_message(message, *args):
+    "synchronous diagnostics, i.e. for replay"
+    print(message % args)
+
+
+def write_stdout(text):
+    sys.stdout.write(text + '\n')
+    sys.stdout.flush()
+
+
+class Diagnostics:
+    """
+    print() replacement for the control loop. Messages are formatted and
+    written by background thread, at most rate lines per second. Message
+    arriving while the previous one of the same format is still waiting
+    replaces it (merged), new formats over max_pending are dropped.
+    The caller never waits for the output.
+    """
+    def __init__(self, write=None, rate=20.0, max_pending=100):
+        self.write = write_stdout if write is None else write
+        self.period = 1.0 / rate if rate else 0.0
+        self.max_pending = max_pending
+        self.pending = OrderedDict()  # message: [args, number of merged]
+        self.condition = Condition()
+        self.running = True
+        self.written = 0
+        self.merged = 0
+        self.dropped = 0
+        self.errors = 0
+        self.thread = Thread(target=self.writer_loop, daemon=True)
+        self.thread.start()
+
+    def __call__(self, message, *args):
+        "queue message % args, args must not be modified after the call"
+        with self.condition:
+            item = self.pending.get(message)
+            if item is not None:
+                item[0] = args
+                item[1] += 1
+                self.merged += 1
+            elif len(self.pending) < self.max_pending:
+                self.pending[message] = [args, 0]
+                self.condition.notify()
+            else:
+                self.dropped += 1
+
+    def writer_loop(self):
+        while True:
+            with self.condition:
+                while self.running and len(self.pending) == 0:
+                    self.condition.wait()
+                if len(self.pending) == 0:
+                    break
+                message, (args, merged) = self.pending.popitem(last=False)
+            text = message % args
+            if merged > 0:
+                text += ' (+%d merged)' % merged
+            try:
+                self.write(text)
+                self.written += 1
+            except Exception:
+                self.errors += 1  # i.e. closed terminal must not stop the robot
+            if self.period > 0 and self.running:
+                time.sleep(self.period)
+
+    @property
+    def stats(self):
+        return {'written': self.written, 'merged': self.merged, 'dropped': self.dropped,
+                'errors': self.errors, 'pending': len(self.pending)}
+
+    def close(self):
+        "write pending messages without rate limit and stop the writer"
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join()
+
+    # context manager functions
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+# vim: expandtab sw=4 ts=4
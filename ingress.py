@@ -0,0 +1,56 @@
+"""
+  Socket ingress - recv_into preallocated buffer, everything the socket
+  already has is taken in one call
+"""
+
+import socket
+
+
+DEFAULT_CAPACITY = 0x10000
+DONTWAIT = getattr(socket, 'MSG_DONTWAIT', None)  # not available on Windows
+
+
+class SocketIngress:
+    """
+    read() blocks until some data arrive and then drains the socket up to
+    capacity bytes. The buffer is allocated once and reused, so the returned
+    memoryview is valid only until the next read().
+    """
+    def __init__(self, soc, capacity=DEFAULT_CAPACITY):
+        self.soc = soc
+        self.buf = bytearray(capacity)
+        self.view = memoryview(self.buf)
+        self.reads = 0
+        self.syscalls = 0
+        self.bytes_received = 0
+        self.max_batch = 0
+
+    def read(self):
+        "return memoryview of received data, empty one when the connection is closed"
+        view = self.view
+        size = self.soc.recv_into(view)
+        syscalls = 1
+        if DONTWAIT is not None:
+            while 0 < size < len(view):
+                syscalls += 1
+                try:
+                    received = self.soc.recv_into(view[size:], 0, DONTWAIT)
+                except (BlockingIOError, InterruptedError):
+                    break  # drained
+                if received == 0:
+                    break  # closed, reported by the next read()
+                size += received
+        self.reads += 1
+        self.syscalls += syscalls
+        self.bytes_received += size
+        if size > self.max_batch:
+            self.max_batch = size
+        return view[:size]
+
+    @property
+    def stats(self):
+        return {'reads': self.reads, 'syscalls': self.syscalls,
+                'bytes_received': self.bytes_received, 'max_batch': self.max_batch,
+                'mean_batch': self.bytes_received / max(1, self.reads)}
+
+# vim: expandtab sw=4 ts=4
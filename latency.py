@@ -0,0 +1,124 @@
+"""
+  Low overhead latency histograms of the control loop
+"""
+
+import json
+import time
+
+
+SUB_BUCKET_BITS = 5  # 16 sub-buckets per power of two, i.e. ~6% precision
+
+
+class Histogram:
+    "HDR style histogram of integer values (microseconds) with log-linear buckets"
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    @staticmethod
+    def bucket(value):
+        shift = max(0, value.bit_length() - SUB_BUCKET_BITS)
+        return (shift << (SUB_BUCKET_BITS - 1)) + (value >> shift)
+
+    @staticmethod
+    def bucket_value(index):
+        "the lowest value of the bucket"
+        half = 1 << (SUB_BUCKET_BITS - 1)
+        if index < 2 * half:
+            return index
+        shift = index // half - 1
+        return (index - shift * half) << shift
+
+    def record(self, value):
+        index = self.bucket(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        for value in [other.min, other.max]:
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, p):
+        if self.count == 0:
+            return None
+        limit = self.count * p / 100.0
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= limit:
+                return min(self.bucket_value(index), self.max)
+        return self.max
+
+    def to_dict(self):
+        return {'count': self.count, 'total': self.total, 'min': self.min, 'max': self.max,
+                'buckets': sorted(self.counts.items())}
+
+    @classmethod
+    def from_dict(cls, d):
+        ret = cls()
+        ret.counts = dict(d['buckets'])
+        ret.count, ret.total, ret.min, ret.max = d['count'], d['total'], d['min'], d['max']
+        return ret
+
+    def __str__(self):
+        if self.count == 0:
+            return 'n=0'
+        return 'n=%d mean=%dus p50=%dus p90=%dus p99=%dus max=%dus' % (
+                self.count, self.total // self.count, self.percentile(50),
+                self.percentile(90), self.percentile(99), self.max)
+
+
+class LatencyMonitor:
+    """
+    Collect durations of named parts of the control loop. Every period
+    seconds the histograms of the last interval are passed as JSON to
+    write() (i.e. into dedicated log stream), totals are kept for summary.
+    """
+    def __init__(self, write=None, period=10.0):
+        self.write = write
+        self.period = period
+        self.interval = {}
+        self.totals = {}
+        self.last_flush = time.perf_counter()
+
+    def record(self, name, start, end):
+        "record duration between two perf_counter() values"
+        hist = self.interval.get(name)
+        if hist is None:
+            hist = self.interval[name] = Histogram()
+        hist.record(int((end - start) * 1000000))
+
+    def tick(self, now):
+        if now - self.last_flush >= self.period:
+            self.flush(now)
+
+    def flush(self, now=None):
+        if now is None:
+            now = time.perf_counter()
+        if self.write is not None and len(self.interval) > 0:
+            data = {name: hist.to_dict() for name, hist in self.interval.items()}
+            self.write(bytes(json.dumps(data), encoding='utf-8'))
+        for name, hist in self.interval.items():
+            self.totals.setdefault(name, Histogram()).merge(hist)
+        self.interval = {}
+        self.last_flush = now
+
+    def summary(self):
+        self.flush()
+        return '\n'.join(['%-10s %s' % (name, hist) for name, hist in sorted(self.totals.items())])
+
+# vim: expandtab sw=4 ts=4
@@ -0,0 +1,137 @@
+"""
+  Headless summary of many logs processed in parallel.
+  usage:
+     python logbatch.py <log files or directories> [--jobs N] [--format csv|json]
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+from multiprocessing import Pool
+
+from logger import open_log
+from naio import NaioDecoder
+
+
+ANNOT_STREAM = 0
+INPUT_STREAM = 1
+
+ODOMETRY_ID = 0x06
+GYRO_ID = 0x0A
+
+ODOMETRY_STEP = 6.465/400.0  # meters per tick
+GYRO_GAIN = 30.5/1000.0  # deg/sec per raw unit
+
+
+def summarize(filename):
+    "return dict of statistics collected in one pass over the log"
+    decoder = NaioDecoder()
+    msg_counts = {}
+    prev_odo = b'\x00\x00\x00\x00'
+    total_dist_raw = 0
+    gyro_min, gyro_max = None, None
+    tag_begin = {}
+    tag_time = {}
+    microseconds = 0
+    with open_log(filename) as log:
+        num_records = 0
+        for microseconds, stream_id, data in log.records():
+            num_records += 1
+            if stream_id == INPUT_STREAM:
+                decoder.feed(data)
+                for msg_id, payload in decoder.frames():
+                    msg_counts[msg_id] = msg_counts.get(msg_id, 0) + 1
+                    if msg_id == ODOMETRY_ID:
+                        payload = bytes(payload)
+                        total_dist_raw += sum([a^b for a, b in zip(prev_odo, payload)])
+                        prev_odo = payload
+                    elif msg_id == GYRO_ID and len(payload) == 6:
+                        gyro = [int.from_bytes(payload[i:i+2], 'big', signed=True) for i in (0, 2, 4)]
+                        if gyro_min is None:
+                            gyro_min, gyro_max = gyro, gyro
+                        gyro_min = [min(a, b) for a, b in zip(gyro_min, gyro)]
+                        gyro_max = [max(a, b) for a, b in zip(gyro_max, gyro)]
+            elif stream_id == ANNOT_STREAM:
+                # TAG:<name>:BEGIN or TAG:<name>:END
+                tag = bytes(data).split(b':')
+                if len(tag) == 3 and tag[0] == b'TAG':
+                    name = tag[1].decode('utf-8', 'replace')
+                    if tag[2] == b'BEGIN':
+                        tag_begin[name] = microseconds
+                    elif tag[2] == b'END' and name in tag_begin:
+                        duration = microseconds - tag_begin.pop(name)
+                        tag_time[name] = tag_time.get(name, 0) + duration
+
+    ret = {
+        'filename': filename,
+        'duration': microseconds / 1000000.0,
+        'records': num_records,
+        'distance': total_dist_raw * ODOMETRY_STEP,
+        'bad_frames': decoder.bad_frames,
+    }
+    for msg_id, count in msg_counts.items():
+        ret['msg_%02X' % msg_id] = count
+    if gyro_min is not None:
+        for axis, low, high in zip('xyz', gyro_min, gyro_max):
+            ret['gyro_%s_min' % axis] = low * GYRO_GAIN
+            ret['gyro_%s_max' % axis] = high * GYRO_GAIN
+    for name, duration in tag_time.items():
+        ret['tag_%s' % name] = duration / 1000000.0
+    return ret
+
+
+def safe_summarize(filename):
+    try:
+        return summarize(filename)
+    except Exception as e:
+        return {'filename': filename, 'error': repr(e)}
+
+
+def find_logs(paths):
+    ret = []
+    for path in paths:
+        if os.path.isdir(path):
+            ret.extend(sorted(glob.glob(os.path.join(path, 'naio*.log'))))
+        else:
+            ret.append(path)
+    return ret
+
+
+def batch(filenames, jobs=None):
+    "summarize logs in process pool, the order of filenames is kept"
+    with Pool(processes=jobs) as pool:
+        return pool.map(safe_summarize, filenames, chunksize=1)
+
+
+def write_table(rows, f, output_format='csv'):
+    if output_format == 'json':
+        json.dump(rows, f, indent=2)
+        f.write('\n')
+        return
+    columns = []
+    for row in rows:
+        columns.extend([key for key in row if key not in columns])
+    writer = csv.DictWriter(f, fieldnames=columns)
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summarize logs in parallel')
+    parser.add_argument('paths', nargs='+', help='log files or directories with naio*.log')
+    parser.add_argument('--jobs', '-j', type=int, help='number of processes (default all cores)')
+    parser.add_argument('--format', dest='output_format', choices=['csv', 'json'], default='csv')
+    parser.add_argument('--output', '-o', help='output file (default stdout)')
+    args = parser.parse_args()
+
+    rows = batch(find_logs(args.paths), jobs=args.jobs)
+    if args.output is None:
+        write_table(rows, sys.stdout, args.output_format)
+    else:
+        with open(args.output, 'w', newline='') as f:
+            write_table(rows, f, args.output_format)
+
+# vim: expandtab sw=4 ts=4
@@ -0,0 +1,166 @@
+"""
+  Columnar cache of sensor data decoded from a log file.
+  The cache directory <log file>.cache contains one raw array per column,
+  which can be memory mapped. It is rebuilt when size or mtime of the log
+  changes.
+  usage:
+     python logcache.py <log file> [--force]
+"""
+
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+
+from logger import open_log
+from naio import NaioDecoder
+
+
+INPUT_STREAM = 1
+OUTPUT_STREAM = 2
+
+MOTOR_ID = 0x01
+ODOMETRY_ID = 0x06
+LASER_ID = 0x07
+GYRO_ID = 0x0A
+
+CACHE_VERSION = 1
+
+# name: (dtype, shape of one row), all times are in microseconds
+COLUMNS = {
+    'laser_time': ('<i8', ()),
+    'laser_dist': ('<u2', (271,)),  # mm, 0 = no reflection
+    'laser_intensity': ('u1', (271,)),
+    'odometry_time': ('<i8', ()),
+    'odometry_raw': ('u1', (4,)),  # FR, RR, RL, FL
+    'odometry_ticks': ('<i8', (2,)),  # accumulated left and right
+    'gyro_time': ('<i8', ()),
+    'gyro_raw': ('<i2', (3,)),  # X, Y, Z (gain factor 30.5)
+    'motor_time': ('<i8', ()),
+    'motor_pwm': ('i1', (2,)),  # left, right
+}
+
+
+def cache_dir(filename):
+    return filename + '.cache'
+
+
+def log_key(filename):
+    st = os.stat(filename)
+    return {'log_size': st.st_size, 'log_mtime': st.st_mtime_ns}
+
+
+class ColumnWriter:
+    "append rows to raw column files"
+    def __init__(self, dirname):
+        self.dirname = dirname
+        self.files = {name: open(os.path.join(dirname, name + '.bin'), 'wb')
+                      for name in COLUMNS}
+        self.rows = dict.fromkeys(COLUMNS, 0)
+
+    def append(self, name, data):
+        self.files[name].write(data)
+        self.rows[name] += 1
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+
+def export(filename):
+    "decode whole log in one pass and write the column cache"
+    dirname = cache_dir(filename)
+    if os.path.exists(dirname):
+        shutil.rmtree(dirname)
+    os.mkdir(dirname)
+    key = log_key(filename)
+
+    columns = ColumnWriter(dirname)
+    input_decoder = NaioDecoder()
+    output_decoder = NaioDecoder()
+    prev_odo = None
+    ticks = np.zeros(2, dtype='<i8')
+    with open_log(filename) as log:
+        for microseconds, stream_id, data in log.records():
+            if stream_id == INPUT_STREAM:
+                input_decoder.feed(data)
+                time = np.int64(microseconds).tobytes()
+                for msg_id, payload in input_decoder.frames():
+                    if msg_id == LASER_ID:
+                        columns.append('laser_time', time)
+                        columns.append('laser_dist',
+                                       np.frombuffer(payload, '>u2', 271).astype('<u2').tobytes())
+                        columns.append('laser_intensity', payload[2*271:3*271])
+                    elif msg_id == ODOMETRY_ID:
+                        payload = bytes(payload)
+                        if prev_odo is not None:
+                            diff = [a^b for a, b in zip(prev_odo, payload)]
+                            ticks += (diff[2] + diff[3], diff[0] + diff[1])
+                        prev_odo = payload
+                        columns.append('odometry_time', time)
+                        columns.append('odometry_raw', payload)
+                        columns.append('odometry_ticks', ticks.tobytes())
+                    elif msg_id == GYRO_ID:
+                        columns.append('gyro_time', time)
+                        columns.append('gyro_raw',
+                                       np.frombuffer(payload, '>i2', 3).astype('<i2').tobytes())
+            elif stream_id == OUTPUT_STREAM:
+                output_decoder.feed(data)
+                for msg_id, payload in output_decoder.frames():
+                    if msg_id == MOTOR_ID:
+                        columns.append('motor_time', np.int64(microseconds).tobytes())
+                        columns.append('motor_pwm', payload)
+    columns.close()
+
+    meta = dict(key, version=CACHE_VERSION, columns={
+            name: {'dtype': dtype, 'shape': [columns.rows[name]] + list(shape)}
+            for name, (dtype, shape) in COLUMNS.items()})
+    # meta file is written last - it marks complete cache
+    with open(os.path.join(dirname, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def read_meta(filename):
+    "return cache description or None if the cache is missing or outdated"
+    try:
+        with open(os.path.join(cache_dir(filename), 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != CACHE_VERSION:
+        return None
+    for name, value in log_key(filename).items():
+        if meta.get(name) != value:
+            return None
+    return meta
+
+
+def load(filename, rebuild=False):
+    "return dict of memory mapped columns, the cache is created when needed"
+    meta = None if rebuild else read_meta(filename)
+    if meta is None:
+        meta = export(filename)
+    ret = {}
+    for name, column in meta['columns'].items():
+        shape = tuple(column['shape'])
+        if shape[0] == 0:
+            ret[name] = np.zeros(shape, dtype=column['dtype'])  # empty file cannot be mapped
+        else:
+            path = os.path.join(cache_dir(filename), name + '.bin')
+            ret[name] = np.memmap(path, dtype=column['dtype'], mode='r', shape=shape)
+    return ret
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Cache sensor data of log file as columnar arrays')
+    parser.add_argument('filename', help='logfile')
+    parser.add_argument('--force', '-f', action='store_true', help='rebuild existing cache')
+    args = parser.parse_args()
+
+    for name, arr in sorted(load(args.filename, rebuild=args.force).items()):
+        print('%-16s %-6s %s' % (name, arr.dtype, arr.shape))
+
+# vim: expandtab sw=4 ts=4
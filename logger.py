@@ -1,23 +1,74 @@
-# Pyromania logger ver0
+# Pyromania logger ver0, ver1 and ver2 (ver1 records in compressed blocks)
 
 import datetime
+import lzma
+import mmap
+import os
 import struct
-from threading import Lock
+import heapq
+import time
+import zlib
+from bisect import bisect_left, bisect_right
+from collections import deque
+from queue import Queue, Empty, Full
+from threading import Condition, Lock, Thread
 
 
 INFO_STREM_ID = 0
 
+# record header: microseconds, stream_id, size
+RECORD_HEADERS = {
+    0: struct.Struct('IHH'),  # ver0 - up to 1 hour and 64KB records
+    1: struct.Struct('<QHI'),  # ver1 - 64bit time and 32bit size
+    2: struct.Struct('<QHI'),  # ver2 - ver1 records stored in compressed blocks
+}
+
+# ver2 block header: codec, compressed size, raw size, first and last microseconds
+BLOCK_HEADER = struct.Struct('<BIIQQ')
+INDEX_ENTRY = struct.Struct('<QBIIQQ')  # file offset + block header
+INDEX_TRAILER = struct.Struct('<Q4s')  # file offset of index block, magic
+INDEX_MAGIC = b'PyrX'
+
+CODEC_INDEX = 0
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+COMPRESSION_CODECS = {'zlib': CODEC_ZLIB, 'lzma': CODEC_LZMA}
+DEFAULT_LEVELS = {CODEC_ZLIB: 6, CODEC_LZMA: 1}
+
+MICROSECOND = datetime.timedelta(microseconds=1)
+
 class LogEnd(Exception):
   pass
 
 
+def compress_block(codec, data, level):
+    if codec == CODEC_ZLIB:
+        return zlib.compress(data, level)
+    assert codec == CODEC_LZMA, codec
+    return lzma.compress(data, preset=level)
+
+
+def decompress_block(codec, data):
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data)
+    assert codec == CODEC_LZMA, codec
+    return lzma.decompress(data)
+
+
 class LogWriter:
-    def __init__(self, prefix='naio', note=''):
+    def __init__(self, prefix='naio', note='', version=0, start_time=None, overwrite=True):
+        """
+        start_time is given only for records with explicit time, see write_record(),
+        with overwrite=False existing file raises FileExistsError
+        """
         self.lock = Lock()
-        self.start_time = datetime.datetime.now()
+        self.version = version
+        self.header = RECORD_HEADERS[version]
+        self.start_time = datetime.datetime.now() if start_time is None else start_time
+        self.write_wait = {}  # stream_id: [count, total, max] in seconds
         self.filename = prefix + self.start_time.strftime("%y%m%d_%H%M%S.log")
-        self.f = open(self.filename, 'wb')
-        self.f.write(b'Pyr\x00')
+        self.f = open(self.filename, 'wb' if overwrite else 'xb')
+        self.f.write(b'Pyr' + bytes([version]))
         
         t = self.start_time
         self.f.write(struct.pack('HBBBBBI', t.year, t.month, t.day,
@@ -27,18 +78,52 @@ class LogWriter:
             self.write(stream_id=INFO_STREM_ID, data=bytes(note, encoding='utf-8'))
 
     def write(self, stream_id, data):
+        start = time.perf_counter()
         self.lock.acquire()
         dt = datetime.datetime.now() - self.start_time
-        assert dt.days == 0, dt
-        assert dt.seconds < 3600, dt  # overflow not supported yet
-        assert len(data) < 0x10000, len(data)  # large data blocks are not supported yet
-        self.f.write(struct.pack('IHH', dt.seconds * 1000000 + dt.microseconds,
-                stream_id, len(data)))
+        self.f.write(self.pack_header(dt, stream_id, len(data)))
         self.f.write(data)
         self.f.flush()
+        self.account_wait(stream_id, start)
         self.lock.release()
         return dt
 
+    def write_record(self, dt, stream_id, data):
+        "write record with explicit time, i.e. generated or copied data"
+        self.lock.acquire()
+        self.f.write(self.pack_header(dt, stream_id, len(data)))
+        self.f.write(data)
+        self.lock.release()
+
+    def pack_header(self, dt, stream_id, size):
+        if self.version == 0:
+            assert dt.days == 0, dt
+            assert dt.seconds < 3600, dt  # use ver1 for longer logs
+            assert size < 0x10000, size  # use ver1 for large data blocks
+        else:
+            assert size < 0x100000000, size
+        return self.header.pack(dt // MICROSECOND, stream_id, size)
+
+    def account_wait(self, stream_id, start):
+        "add time since perf_counter() start to write() of the stream, caller holds its lock"
+        duration = time.perf_counter() - start
+        wait = self.write_wait.get(stream_id)
+        if wait is None:
+            wait = self.write_wait.setdefault(stream_id, [0, 0.0, 0.0])
+        wait[0] += 1
+        wait[1] += duration
+        if duration > wait[2]:
+            wait[2] = duration
+
+    @property
+    def stats(self):
+        "time spent in write() per stream"
+        ret = {}
+        for stream_id, (count, total, longest) in list(self.write_wait.items()):
+            ret['write_wait_%d' % stream_id] = {'count': count, 'mean_us': 1e6 * total / count,
+                                                'max_us': 1e6 * longest}
+        return ret
+
     def close(self):
         self.f.close()
         self.f = None
@@ -52,27 +137,706 @@ class LogWriter:
         self.close()
 
 
+class BufferedLogWriter(LogWriter):
+    """
+    Records are queued and the caller returns immediately with the timestamp.
+    Background thread joins them into large writes and flushes the file
+    every flush_period seconds or flush_size bytes (None disables the rule).
+    With block=False the records are dropped when the queue is full,
+    otherwise the caller waits up to block_timeout seconds for the writer.
+    Failure of the writer thread is raised by the next blocked write()
+    and by close().
+    """
+    def __init__(self, prefix='naio', note='', version=0, flush_period=0.1, flush_size=0x10000,
+                 fsync=False, max_queue=10000, block=True, block_timeout=10.0):
+        self.flush_period = flush_period
+        self.flush_size = flush_size
+        self.fsync = fsync
+        self.block = block
+        self.block_timeout = block_timeout
+        self.queue = Queue(maxsize=max_queue)
+        self.space = Condition()  # notified when a queued record is taken
+        self.waiting = 0  # callers waiting for space
+        self.error = None  # exception of the writer thread
+        self.max_queue_depth = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.bytes_written = 0
+        self.thread = Thread(target=self.writer_loop, daemon=True)
+        super().__init__(prefix=prefix, note=note, version=version)
+        self.thread.start()
+
+    def write(self, stream_id, data):
+        start = time.perf_counter()
+        if not isinstance(data, bytes):
+            data = bytes(data)  # caller is free to reuse its buffer
+        blocked = False
+        while True:
+            with self.lock:
+                # the time is taken when the record is queued, so the records stay in order
+                dt = datetime.datetime.now() - self.start_time
+                try:
+                    self.queue.put_nowait((self.pack_header(dt, stream_id, len(data)), data))
+                    self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+                    self.account_wait(stream_id, start)
+                    return dt
+                except Full:
+                    if not self.block:
+                        self.dropped += 1
+                        return dt
+                    if not blocked:
+                        self.blocked += 1
+                        blocked = True
+            self.wait_for_space()
+
+    def write_record(self, dt, stream_id, data):
+        item = (self.pack_header(dt, stream_id, len(data)), bytes(data))
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except Full:
+                self.wait_for_space()
+
+    def wait_for_space(self):
+        "wait without the lock till the writer takes a record, raise its failure or timeout"
+        deadline = time.monotonic() + self.block_timeout
+        with self.space:
+            self.waiting += 1
+            try:
+                while self.queue.full():
+                    if self.error is not None:
+                        raise self.error
+                    if not self.thread.is_alive():
+                        raise RuntimeError('log writer thread is not running')
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError('log writer blocked for %.1fs' % self.block_timeout)
+                    self.space.wait(min(remaining, 0.1))
+            finally:
+                self.waiting -= 1
+
+    def writer_loop(self):
+        try:
+            self.write_batches()
+        except Exception as e:
+            self.error = e  # raised to the callers
+        finally:
+            with self.space:
+                self.space.notify_all()
+
+    def write_batches(self):
+        batch = bytearray()
+        last_flush = time.monotonic()
+        while True:
+            timeout = None
+            if len(batch) > 0 and self.flush_period is not None:
+                timeout = max(0, last_flush + self.flush_period - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except Empty:
+                item = b''  # time to flush
+            if self.waiting > 0:
+                with self.space:
+                    self.space.notify_all()
+            if item is None:
+                break
+            if item:
+                batch += item[0]
+                batch += item[1]
+            now = time.monotonic()
+            if (item == b''
+                    or (self.flush_size is not None and len(batch) >= self.flush_size)
+                    or (self.flush_period is not None and now - last_flush >= self.flush_period)):
+                self.f.write(batch)
+                self.f.flush()
+                self.bytes_written += len(batch)
+                batch.clear()
+                last_flush = now
+        if len(batch) > 0:
+            self.f.write(batch)
+            self.bytes_written += len(batch)
+        self.f.flush()
+
+    @property
+    def stats(self):
+        ret = {'queue_depth': self.queue.qsize(), 'max_queue_depth': self.max_queue_depth,
+               'dropped': self.dropped, 'blocked': self.blocked,
+               'bytes_written': self.bytes_written}
+        ret.update(super().stats)
+        return ret
+
+    def close(self):
+        "drain and terminate writer thread, its failure is raised after closing the file"
+        while self.thread.is_alive():
+            try:
+                self.queue.put(None, timeout=0.1)
+                break
+            except Full:
+                pass
+        self.thread.join()
+        if self.fsync and self.error is None:
+            os.fsync(self.f.fileno())
+        super().close()
+        if self.error is not None:
+            raise self.error
+
+
+class LaneLogWriter(LogWriter):
+    """
+    Every stream has its own lane (deque with lock) so writers of different
+    streams never wait for each other nor for the disk. The time is taken
+    under the lane lock, so every lane is sorted even with several writing
+    threads. Background thread merges the lanes in time order every
+    flush_period seconds up to the watermark, the time when the lanes were
+    collected, younger records wait for the next round. The time spent
+    in write() is measured per stream. Failure of the writer thread is
+    raised by the next write() and by close().
+    """
+    def __init__(self, prefix='naio', note='', version=0, flush_period=0.01, fsync=False):
+        self.flush_period = flush_period
+        self.fsync = fsync
+        self.lanes = {}  # stream_id: (lock, records)
+        self.lanes_lock = Lock()  # adding of lanes
+        self.bytes_written = 0
+        self.error = None  # exception of the writer thread
+        self.running = True
+        self.thread = Thread(target=self.writer_loop, daemon=True)
+        super().__init__(prefix=prefix, note=note, version=version)
+        self.thread.start()
+
+    def lane(self, stream_id):
+        lane = self.lanes.get(stream_id)
+        if lane is None:
+            with self.lanes_lock:
+                lane = self.lanes.setdefault(stream_id, (Lock(), deque()))
+        return lane
+
+    def write(self, stream_id, data):
+        start = time.perf_counter()
+        if self.error is not None:
+            raise self.error
+        if not isinstance(data, bytes):
+            data = bytes(data)  # caller is free to reuse its buffer
+        lock, records = self.lane(stream_id)
+        with lock:
+            dt = datetime.datetime.now() - self.start_time
+            records.append((dt, self.pack_header(dt, stream_id, len(data)), data))
+            self.account_wait(stream_id, start)
+        return dt
+
+    def write_record(self, dt, stream_id, data):
+        "records with explicit time must not be older than already written ones"
+        if self.error is not None:
+            raise self.error
+        lock, records = self.lane(stream_id)
+        with lock:
+            records.append((dt, self.pack_header(dt, stream_id, len(data)), bytes(data)))
+
+    def drain_lanes(self):
+        """
+        return (watermark, list of records of every lane), records with time
+        up to the watermark are complete - later write() takes newer time
+        """
+        with self.lanes_lock:
+            watermark = datetime.datetime.now() - self.start_time
+            lanes = list(self.lanes.values())
+        ret = []
+        for lock, records in lanes:
+            with lock:
+                items = list(records)
+                records.clear()
+            ret.append(items)
+        return watermark, ret
+
+    def writer_loop(self):
+        try:
+            self.merge_lanes()
+        except Exception as e:
+            self.error = e  # raised to the callers
+
+    def merge_lanes(self):
+        pending = []
+        while self.running:
+            time.sleep(self.flush_period)
+            watermark, lanes = self.drain_lanes()
+            records = list(heapq.merge(pending, *lanes, key=lambda item: item[0]))
+            split = len(records)
+            while split > 0 and records[split - 1][0] > watermark:
+                split -= 1
+            self.write_records(records[:split])
+            pending = records[split:]
+        __, lanes = self.drain_lanes()
+        self.write_records(heapq.merge(pending, *lanes, key=lambda item: item[0]))
+
+    def write_records(self, records):
+        batch = bytearray()
+        for __, header, data in records:
+            batch += header
+            batch += data
+        if len(batch) > 0:
+            self.f.write(batch)
+            self.f.flush()
+            self.bytes_written += len(batch)
+
+    @property
+    def stats(self):
+        ret = {'bytes_written': self.bytes_written,
+               'queue_depth': sum([len(records) for __, records in list(self.lanes.values())])}
+        ret.update(super().stats)
+        return ret
+
+    def close(self):
+        "write remaining records, failure of the writer is raised after closing the file"
+        self.running = False
+        self.thread.join()
+        if self.fsync and self.error is None:
+            os.fsync(self.f.fileno())
+        super().close()
+        if self.error is not None:
+            raise self.error
+
+
+class CompressedLogWriter(LogWriter):
+    """
+    Records are collected into blocks of block_size bytes (or flush_period
+    seconds of log time) which are compressed by zlib or lzma and written by
+    background thread. Partial block is written also when no block was
+    completed for flush_period seconds. Index of blocks is appended on close,
+    log of crashed run is readable up to its last written block.
+    When the queue of blocks is full the caller waits up to block_timeout
+    seconds, failure of the writer thread is raised by write() and close().
+    """
+    def __init__(self, prefix='naio', note='', version=2, compression='zlib', level=None,
+                 block_size=0x100000, flush_period=1.0, max_queue=16, block_timeout=10.0):
+        if version != 2:
+            raise ValueError('compressed log is always ver2, got %d' % version)
+        # records are always ver1 inside of compressed blocks
+        self.codec = COMPRESSION_CODECS[compression]
+        self.level = DEFAULT_LEVELS[self.codec] if level is None else level
+        self.block_size = block_size
+        self.flush_period = flush_period
+        self.block_timeout = block_timeout
+        self.block = bytearray()
+        self.block_first = None
+        self.block_last = None
+        self.blocks = []  # index entries
+        self.blocks_queued = 0
+        self.queue = Queue(maxsize=max_queue)
+        self.space = Condition()  # notified when a block is taken or written
+        self.waiting = 0  # callers waiting for the writer
+        self.error = None  # exception of the writer thread
+        self.bytes_in = 0
+        self.bytes_written = 0
+        self.thread = Thread(target=self.writer_loop, daemon=True)
+        super().__init__(prefix=prefix, note=note, version=version)
+        self.thread.start()
+
+    def write(self, stream_id, data):
+        start = time.perf_counter()
+        while True:
+            with self.lock:
+                # complete block waits for space in the queue, so the records stay in order
+                if not self.block_full() or self.flush_block():
+                    dt = datetime.datetime.now() - self.start_time
+                    self.append(dt, stream_id, data)
+                    self.account_wait(stream_id, start)
+                    return dt
+            self.wait_for_writer(self.has_space)
+
+    def write_record(self, dt, stream_id, data):
+        while True:
+            with self.lock:
+                if not self.block_full() or self.flush_block():
+                    self.append(dt, stream_id, data)
+                    return
+            self.wait_for_writer(self.has_space)
+
+    def append(self, dt, stream_id, data):
+        microseconds = dt // MICROSECOND
+        if self.block_first is None:
+            self.block_first = self.block_last = microseconds
+        self.block_first = min(self.block_first, microseconds)
+        self.block_last = max(self.block_last, microseconds)
+        self.block += self.pack_header(dt, stream_id, len(data))
+        self.block += data
+        if self.block_full():
+            self.flush_block()  # retried by the next write() when the queue is full
+
+    def block_full(self):
+        return (len(self.block) >= self.block_size
+                or (self.block_first is not None
+                    and self.block_last - self.block_first >= self.flush_period * 1000000))
+
+    def flush_block(self):
+        "queue collected records, return False when the queue is full, caller holds the lock"
+        if len(self.block) > 0:
+            try:
+                self.queue.put_nowait((bytes(self.block), self.block_first, self.block_last))
+            except Full:
+                return False
+            self.blocks_queued += 1
+            self.block.clear()
+            self.block_first = self.block_last = None
+        return True
+
+    def has_space(self):
+        return not self.queue.full()
+
+    def wait_for_writer(self, done):
+        "wait without the lock till done() is true, raise failure of the writer or timeout"
+        deadline = time.monotonic() + self.block_timeout
+        with self.space:
+            self.waiting += 1
+            try:
+                while not done():
+                    if self.error is not None:
+                        raise self.error
+                    if not self.thread.is_alive():
+                        raise RuntimeError('log writer thread is not running')
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError('log writer blocked for %.1fs' % self.block_timeout)
+                    self.space.wait(min(remaining, 0.1))
+            finally:
+                self.waiting -= 1
+
+    def notify_waiting(self):
+        if self.waiting > 0:
+            with self.space:
+                self.space.notify_all()
+
+    def writer_loop(self):
+        try:
+            self.write_blocks()
+        except Exception as e:
+            self.error = e  # raised to the callers
+        finally:
+            with self.space:
+                self.space.notify_all()
+
+    def write_blocks(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_period)
+            except Empty:
+                with self.lock:
+                    self.flush_block()  # no block was completed for flush_period
+                continue
+            self.notify_waiting()
+            if item is None:
+                break
+            data, first, last = item
+            compressed = compress_block(self.codec, data, self.level)
+            offset = self.f.tell()
+            self.f.write(BLOCK_HEADER.pack(self.codec, len(compressed), len(data), first, last))
+            self.f.write(compressed)
+            self.f.flush()
+            self.blocks.append((offset, self.codec, len(compressed), len(data), first, last))
+            self.bytes_in += len(data)
+            self.bytes_written += BLOCK_HEADER.size + len(compressed)
+            self.notify_waiting()
+
+    def flush(self):
+        "write collected records and wait till they are in the file"
+        while True:
+            with self.lock:
+                if self.flush_block():
+                    queued = self.blocks_queued
+                    break
+            self.wait_for_writer(self.has_space)
+        self.wait_for_writer(lambda: len(self.blocks) >= queued)
+
+    @property
+    def stats(self):
+        ret = {'blocks': len(self.blocks), 'queue_depth': self.queue.qsize(),
+               'bytes_in': self.bytes_in, 'bytes_written': self.bytes_written,
+               'ratio': self.bytes_written / max(1, self.bytes_in)}
+        ret.update(super().stats)
+        return ret
+
+    def close(self):
+        "write remaining blocks and the index, failure of the writer is raised after closing the file"
+        try:
+            self.flush()
+        finally:
+            while self.thread.is_alive():
+                try:
+                    self.queue.put(None, timeout=0.1)
+                    break
+                except Full:
+                    pass
+            self.thread.join()
+            try:
+                if self.error is None:
+                    self.write_index()
+            finally:
+                super().close()
+        if self.error is not None:
+            raise self.error
+
+    def write_index(self):
+        offset = self.f.tell()
+        index = b''.join([INDEX_ENTRY.pack(*entry) for entry in self.blocks])
+        first = min([entry[4] for entry in self.blocks], default=0)
+        last = max([entry[5] for entry in self.blocks], default=0)
+        self.f.write(BLOCK_HEADER.pack(CODEC_INDEX, len(index), len(index), first, last))
+        self.f.write(index)
+        self.f.write(INDEX_TRAILER.pack(offset, INDEX_MAGIC))
+
+
+class BlockFile:
+    """
+    Read-only file-like view of ver2 records. Offsets are the same as if
+    the decompressed blocks were stored one after another from data_start.
+    Only the blocks being read are decompressed.
+    """
+    def __init__(self, f, data_start):
+        self.f = f
+        self.data_start = data_start
+        self.blocks = self.read_index()
+        if self.blocks is None:
+            self.blocks = list(self.scan_blocks())  # not closed properly
+        self.starts = []  # offsets of blocks
+        self.lasts = []  # time of the last record of every block
+        offset = data_start
+        for entry in self.blocks:
+            self.starts.append(offset)
+            self.lasts.append(entry[5])
+            offset += entry[3]
+        self.size = offset
+        self.pos = data_start
+        self.cached_index = None
+        self.cached_data = None
+
+    def read_index(self):
+        "return list of index entries or None if the index is missing"
+        file_size = os.fstat(self.f.fileno()).st_size
+        if file_size < self.data_start + BLOCK_HEADER.size + INDEX_TRAILER.size:
+            return None
+        self.f.seek(file_size - INDEX_TRAILER.size)
+        offset, magic = INDEX_TRAILER.unpack(self.f.read(INDEX_TRAILER.size))
+        if magic != INDEX_MAGIC:
+            return None
+        self.f.seek(offset)
+        codec, size, __, __, __ = BLOCK_HEADER.unpack(self.f.read(BLOCK_HEADER.size))
+        assert codec == CODEC_INDEX, codec
+        return list(INDEX_ENTRY.iter_unpack(self.f.read(size)))
+
+    def scan_blocks(self, offset=None):
+        "yield index entries of complete blocks"
+        file_size = os.fstat(self.f.fileno()).st_size
+        if offset is None:
+            offset = self.data_start
+        while offset + BLOCK_HEADER.size <= file_size:
+            self.f.seek(offset)
+            header = BLOCK_HEADER.unpack(self.f.read(BLOCK_HEADER.size))
+            if header[0] == CODEC_INDEX or offset + BLOCK_HEADER.size + header[1] > file_size:
+                break
+            yield (offset,) + header
+            offset += BLOCK_HEADER.size + header[1]
+
+    def refresh(self):
+        "add blocks completed by the writer since the last call"
+        offset = None
+        if len(self.blocks) > 0:
+            offset = self.blocks[-1][0] + BLOCK_HEADER.size + self.blocks[-1][2]
+        for entry in self.scan_blocks(offset):
+            self.blocks.append(entry)
+            self.starts.append(self.size)
+            self.lasts.append(entry[5])
+            self.size += entry[3]
+
+    def block(self, i):
+        "return decompressed data of i-th block"
+        if self.cached_index != i:
+            offset, codec, compressed_size = self.blocks[i][:3]
+            self.f.seek(offset + BLOCK_HEADER.size)
+            self.cached_data = decompress_block(codec, self.f.read(compressed_size))
+            self.cached_index = i
+        return self.cached_data
+
+    def read(self, size=-1):
+        end = self.size if size < 0 else min(self.size, self.pos + size)
+        parts = []
+        while self.pos < end:
+            i = bisect_right(self.starts, self.pos) - 1
+            start = self.pos - self.starts[i]
+            part = self.block(i)[start:start + end - self.pos]
+            parts.append(part)
+            self.pos += len(part)
+        return b''.join(parts)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self.pos = offset
+        return offset
+
+    def tell(self):
+        return self.pos
+
+    def seek_time(self, microseconds, header):
+        "return offset of the first record not older than microseconds, only one block is decompressed"
+        i = bisect_left(self.lasts, microseconds)
+        if i == len(self.blocks):
+            return self.size
+        data = self.block(i)
+        offset = 0
+        while offset < len(data):
+            record_time, __, size = header.unpack_from(data, offset)
+            if record_time >= microseconds:
+                break
+            offset += header.size + size
+        return self.starts[i] + offset
+
+    def close(self):
+        self.f.close()
+        self.f = None
+
+
 class LogReader:
     def __init__(self, filename):
         self.filename = filename
         self.f = open(self.filename, 'rb')
         data = self.f.read(4)
-        assert data == b'Pyr\x00', data
+        assert data[:3] == b'Pyr' and data[3] in RECORD_HEADERS, data
+        self.version = data[3]
+        self.header = RECORD_HEADERS[self.version]
         
         data = self.f.read(12)
         self.start_time = datetime.datetime(*struct.unpack('HBBBBBI', data))
+        self.data_start = self.f.tell()
+        if self.version == 2:
+            self.f = BlockFile(self.f, self.data_start)
+        self.index = None  # list of (microseconds, stream_id, offset, size)
+        self.stream_index = None
 
     def read(self, only_stream_id=None):
         "return (time, stream, data)"
         while True:
-            header = self.f.read(8)
-            if len(header) < 8:
+            header = self.f.read(self.header.size)
+            if len(header) < self.header.size:
                 raise LogEnd()
-            microseconds, stream_id, size = struct.unpack('IHH', header)
+            microseconds, stream_id, size = self.header.unpack(header)
+            if only_stream_id is not None and only_stream_id != stream_id:
+                self.f.seek(size, os.SEEK_CUR)  # skip data without reading
+                continue
             dt = datetime.timedelta(microseconds=microseconds)
             data = self.f.read(size)
-            if only_stream_id is None or only_stream_id == stream_id:
-                return dt, stream_id, data
+            if len(data) < size:
+                raise LogEnd()  # incomplete last record
+            return dt, stream_id, data
+
+    def follow(self, only_stream_id=None, timeout=None, poll=0.05):
+        """
+        yield (time, stream, data) of records appended by writer of running log,
+        None is yielded after timeout seconds without new record
+        """
+        waiting_since = time.monotonic()
+        while True:
+            offset = self._tell()
+            try:
+                record = self.read(only_stream_id)
+            except LogEnd:
+                self._seek_offset(offset)  # incomplete record is read again
+                if timeout is not None and time.monotonic() - waiting_since >= timeout:
+                    waiting_since = time.monotonic()
+                    yield None
+                time.sleep(poll)
+                self._refresh()
+                continue
+            waiting_since = time.monotonic()
+            yield record
+
+    def records(self, only_stream_id=None):
+        "iterator of (microseconds, stream, data) from current position"
+        while True:
+            try:
+                dt, stream_id, data = self.read(only_stream_id)
+            except LogEnd:
+                return
+            yield dt // MICROSECOND, stream_id, data
+
+    def _file_size(self):
+        if self.version == 2:
+            return self.f.size
+        return os.fstat(self.f.fileno()).st_size
+
+    def _scan_headers(self):
+        "yield (microseconds, stream_id, offset, size) of complete records"
+        file_size = self._file_size()
+        pos = self.f.tell()
+        offset = self.data_start
+        try:
+            while True:
+                self.f.seek(offset)
+                header = self.f.read(self.header.size)
+                if len(header) < self.header.size:
+                    break
+                microseconds, stream_id, size = self.header.unpack(header)
+                if offset + self.header.size + size > file_size:
+                    break  # incomplete last record
+                yield microseconds, stream_id, offset, size
+                offset += self.header.size + size
+        finally:
+            self.f.seek(pos)
+
+    def build_index(self):
+        "scan record headers (payload is skipped) and map time and stream to file offsets"
+        index = []
+        stream_index = {}
+        for item in self._scan_headers():
+            index.append(item)
+            stream_index.setdefault(item[1], []).append(item)
+        self.index = index
+        self.stream_index = stream_index
+        return index
+
+    def seek(self, time):
+        "move to the first record not older than given timedelta, after the last complete record if none"
+        if self.index is None and self.version == 2:
+            self._seek_offset(self.f.seek_time(time // MICROSECOND, self.header))
+            return
+        if self.index is None:
+            self.build_index()
+        i = bisect_left(self.index, (time // MICROSECOND,))
+        if i < len(self.index):
+            self._seek_offset(self.index[i][2])
+        elif len(self.index) > 0:
+            __, __, offset, size = self.index[-1]
+            self._seek_offset(offset + self.header.size + size)
+        else:
+            self._seek_offset(self.data_start)
+
+    def _seek_offset(self, offset):
+        self.f.seek(offset)
+
+    def _tell(self):
+        return self.f.tell()
+
+    def _refresh(self):
+        "notice data appended to the file"
+        if self.version == 2:
+            self.f.refresh()
+
+    def iter_stream(self, stream_id):
+        "yield (time, stream, data) of single stream, other records are not touched"
+        if self.index is None:
+            self.build_index()
+        for microseconds, __, offset, size in self.stream_index.get(stream_id, []):
+            self.f.seek(offset + self.header.size)
+            yield datetime.timedelta(microseconds=microseconds), stream_id, self.f.read(size)
+
+    def count(self, stream_id=None):
+        "number of records (optionally only of given stream)"
+        if self.index is None:
+            self.build_index()
+        if stream_id is None:
+            return len(self.index)
+        return len(self.stream_index.get(stream_id, []))
 
     def close(self):
         self.f.close()
@@ -86,4 +850,93 @@ class LogReader:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
 
+
+class MmapLogReader(LogReader):
+    "memory mapped reader, data are returned as memoryview slices without copying"
+    def __init__(self, filename):
+        super().__init__(filename)
+        assert self.version < 2, 'compressed log, use open_log()'
+        self.map = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        self.pos = self.data_start
+
+    def headers(self, offset=None):
+        "decode all record headers in one pass, yield (microseconds, stream_id, offset, size)"
+        unpack_from = self.header.unpack_from
+        header_size = self.header.size
+        end = len(self.map)
+        if offset is None:
+            offset = self.data_start
+        while offset + header_size <= end:
+            microseconds, stream_id, size = unpack_from(self.map, offset)
+            if offset + header_size + size > end:
+                break  # incomplete last record
+            yield microseconds, stream_id, offset, size
+            offset += header_size + size
+
+    def _scan_headers(self):
+        return self.headers()
+
+    def records(self, only_stream_id=None):
+        "bulk iterator of (microseconds, stream, data) from current position"
+        view = self.view
+        header_size = self.header.size
+        for microseconds, stream_id, offset, size in self.headers(self.pos):
+            self.pos = offset + header_size + size
+            if only_stream_id is None or only_stream_id == stream_id:
+                yield microseconds, stream_id, view[offset + header_size:self.pos]
+
+    def read(self, only_stream_id=None):
+        "return (time, stream, data) where data is memoryview"
+        end = len(self.map)
+        while True:
+            if self.pos + self.header.size > end:
+                raise LogEnd()
+            microseconds, stream_id, size = self.header.unpack_from(self.map, self.pos)
+            start = self.pos + self.header.size
+            if start + size > end:
+                raise LogEnd()  # incomplete last record
+            self.pos = start + size
+            if only_stream_id is None or only_stream_id == stream_id:
+                return datetime.timedelta(microseconds=microseconds), stream_id, self.view[start:self.pos]
+
+    def _seek_offset(self, offset):
+        self.pos = offset
+
+    def _tell(self):
+        return self.pos
+
+    def _refresh(self):
+        if os.fstat(self.f.fileno()).st_size > len(self.map):
+            # previous mapping is released with the last slice of it
+            self.map = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.view = memoryview(self.map)
+
+    def iter_stream(self, stream_id):
+        "yield (time, stream, data) of single stream as memoryview slices"
+        if self.index is None:
+            self.build_index()
+        view = self.view
+        for microseconds, __, offset, size in self.stream_index.get(stream_id, []):
+            start = offset + self.header.size
+            yield datetime.timedelta(microseconds=microseconds), stream_id, view[start:start + size]
+
+    def close(self):
+        self.view.release()
+        try:
+            self.map.close()
+        except BufferError:
+            pass  # slices still in use, the mapping is released with the last of them
+        self.map = None
+        super().close()
+
+
+def open_log(filename):
+    "return MmapLogReader or LogReader for compressed logs"
+    with open(filename, 'rb') as f:
+        magic = f.read(4)
+    if magic == b'Pyr\x02':
+        return LogReader(filename)
+    return MmapLogReader(filename)
+
 # vim: expandtab sw=4 ts=4
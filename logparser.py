@@ -1,78 +1,129 @@
 """
 Parse already logged data.
 usage:
-   python logparser.py <log file>
+   python logparser.py <log file> [--grid RESOLUTION] [--save PNG]
+   python logparser.py <log file of running robot> --follow
 """
 
 import argparse
-import math
 import sys
 import struct
 import itertools
 from datetime import timedelta
 
-import matplotlib.pyplot as plt
+import numpy as np
 
 from logger import LogReader, LogEnd
+from naio import NaioDecoder
 
 
 INPUT_STREAM = 1
 
-def naio_packets(log):
-    WRAP_SIZE = 6 + 1 + 4 + 4  # NAIO01, type, size + CRC32
-    buf = b''
-    delta = timedelta()
-    read_more = True
-    while True:
-        if read_more:
-            try:
-                delta, __, data = log.read(INPUT_STREAM)
-                buf += data
-                read_more = False
-            except LogEnd:
-                break
-
-        if len(buf) >= WRAP_SIZE:
-            prefix = buf[:6]
-            assert prefix == b'NAIO01', prefix
-            if prefix == b'NAIO01':
-                size = struct.unpack_from('>I', buf, 6+1)[0]
-                if len(buf) >= size + WRAP_SIZE:
-                    yield delta, buf[:size + WRAP_SIZE]
-                    buf = buf[size + WRAP_SIZE:]
-                else:
-                    read_more = True
-            else:
-                print('Skipping', buf[0])
-                buf = buf[1:]  # cut one byte
-        else:
-            read_more = True
+# laser view restricted to 180deg
+LASER_ANGLES = np.radians(np.arange(181) - 90.0)
+LASER_COS = np.cos(LASER_ANGLES)
+LASER_SIN = np.sin(LASER_ANGLES)
 
+def naio_packets(log, decoder=None):
+    "yield (time, msg_id, payload) of received NAIO01 frames"
+    if decoder is None:
+        decoder = NaioDecoder()
+    while True:
+        try:
+            delta, __, data = log.read(INPUT_STREAM)
+        except LogEnd:
+            break
+        decoder.feed(data)
+        for msg_id, payload in decoder.frames():
+            yield delta, msg_id, payload
+    if decoder.bad_frames > 0:
+        print('Skipped %d bad frames (%d bytes)' % (decoder.bad_frames, decoder.skipped_bytes))
+
+
+def laser_ascii(data):
+    "Eduro ASCII art of laser scan"
+    scan = struct.unpack('>' + 'H'*271, data[:2*271])[45:-45]
+    step = 5
+    scan2 = [x == 0 and 10000 or x for x in scan]
+    min_dist_arr = [min(i)/1000.0 for i in
+            [itertools.islice(scan2, start, start + step)
+                for start in range(0, len(scan2), step)]]
+    s = ''
+    for i in min_dist_arr:
+        s += (i < 0.5 and 'X' or (i<1.0 and 'x' or (i<1.5 and '.' or ' ')))
+    return s
+
+
+def follow(filename, timeout=1.0):
+    "print laser ASCII art of running log, only new records are shown"
+    decoder = NaioDecoder()
+    with LogReader(filename) as log:
+        log.seek(timedelta.max)
+        for record in log.follow(INPUT_STREAM, timeout=timeout):
+            if record is None:
+                print('waiting for data ...')
+                continue
+            delta, __, data = record
+            decoder.feed(data)
+            for msg_id, payload in decoder.frames():
+                if msg_id == 0x07:
+                    print(delta, laser_ascii(payload))
+
+
+def laser_points(scans, poses):
+    "return x, y arrays of all reflections, scans are N x 181 distances in mm"
+    valid = scans > 0
+    dist = scans / 1000.0
+    x = poses[:, np.newaxis] + LASER_COS * dist
+    y = LASER_SIN * dist
+    return x[valid], y[valid]
+
+
+def hit_grid(scans, poses, resolution=0.05, max_range=5.0, chunk=1000):
+    """
+    return (grid, extent) where grid counts reflections in cells of given
+    resolution (meters), readings further than max_range are ignored
+    """
+    x0 = poses.min() - max_range if len(poses) > 0 else -max_range
+    x1 = poses.max() + max_range if len(poses) > 0 else max_range
+    width = int(np.ceil((x1 - x0) / resolution))
+    height = int(np.ceil(2 * max_range / resolution))
+    grid = np.zeros(width * height, dtype=np.int64)
+    for start in range(0, len(scans), chunk):
+        part = scans[start:start + chunk]
+        part = np.where(part > 1000 * max_range, 0, part)
+        x, y = laser_points(part, poses[start:start + chunk])
+        ix = ((x - x0) / resolution).astype(np.int64)
+        iy = ((y + max_range) / resolution).astype(np.int64)
+        inside = (ix >= 0) & (ix < width) & (iy >= 0) & (iy < height)
+        grid += np.bincount(iy[inside] * width + ix[inside], minlength=width * height)
+    return grid.reshape(height, width), (x0, x0 + width * resolution, -max_range, max_range)
+
+
+def parse(filename, verbose, gyro_output=False, grid_resolution=None, save=None):
+    import matplotlib
+    if save is not None:
+        matplotlib.use('Agg')  # headless
+    import matplotlib.pyplot as plt  # not needed for headless use of naio_packets()
 
-def parse(filename, verbose, gyro_output=False):
     with LogReader(filename) as log:
         prev_odo = b'\x00\x00\x00\x00'
         total_dist_raw = 0
-        arr = []
+        scans = []
         pose_arr = []
         gyro_arr = []
-        for delta, item in naio_packets(log):
-            prefix, item = item[:6], item[6:]
-            assert prefix == b'NAIO01', prefix
-            msg_id, item = item[:1], item[1:]
-            size, item = struct.unpack('>I', item[:4])[0], item[4:]
-            data, item = item[:size], item[size:]
-            crc32, item = struct.unpack('I', item[:4])[0], item[4:]
-            assert item == b'', item  # failing now due to multiple message in the buffer
+        for delta, msg_id, data in naio_packets(log):
+            size = len(data)
 
             # Odometry
-            if msg_id == b'\x06':
+            if msg_id == 0x06:
+                data = bytes(data)
                 diff = sum([a^b for a, b in zip(prev_odo, data)])
                 prev_odo = data
                 total_dist_raw += diff
 
             # Gyro
-            if msg_id == b'\x0A':
+            if msg_id == 0x0A:
                 assert len(data) == 6, len(data)
                 # X, Y, Z (gain factor 30.5)
                 gyro_raw = struct.unpack('>hhh', data)
@@ -80,46 +131,37 @@ def parse(filename, verbose, gyro_output=False):
                 gyro_arr.append((delta.total_seconds() , [x * 30.5 / 1000.0 for x in gyro_raw]))
 
             # Laser
-            if msg_id == b'\x07':
+            if msg_id == 0x07:
                 assert size == 2*271 + 271, size
-                scan = struct.unpack('>' + 'H'*271, data[:2*271])
-                
-                # restrict laser view to 180deg
-                scan = scan[45:-45]
-
-                d = total_dist_raw * 6.465/400.0
-                pose_arr.append((d, 0))
-                for i, dist_mm in enumerate(scan):
-                    if dist_mm > 0:
-                        angle = math.radians(i-90.0)
-                        dist = dist_mm/1000.0
-                        x, y = d + math.cos(angle)*dist, math.sin(angle)*dist
-                        arr.append((x, y))
-
-                # Eduro ASCII art
-                step = 5
-                scan2 = [x == 0 and 10000 or x for x in scan]
-                min_dist_arr = [min(i)/1000.0 for i in 
-                        [itertools.islice(scan2, start, start + step) 
-                            for start in range(0, len(scan2), step)]]
-                s = ''
-                for i in min_dist_arr:
-                    s += (i < 0.5 and 'X' or (i<1.0 and 'x' or (i<1.5 and '.' or ' ')))
+                scans.append(bytes(data[:2*271]))
+                pose_arr.append(total_dist_raw * 6.465/400.0)
+
                 if verbose:
-                    print(s)
+                    print(laser_ascii(data))
 
+        # restrict laser view to 180deg
+        scans = np.frombuffer(b''.join(scans), dtype='>u2').reshape(-1, 271)[:, 45:-45]
+        poses = np.array(pose_arr)
         if gyro_output:
             plt.plot([x for x, _ in gyro_arr], [y for _, y in gyro_arr], 'o-')
             plt.xlabel('time (sec)')
             plt.ylabel('angular velocity (deg/sec)')
+        elif grid_resolution is not None:
+            grid, extent = hit_grid(scans, poses, resolution=grid_resolution)
+            plt.imshow(np.log1p(grid), origin='lower', extent=extent, cmap='gray_r',
+                       interpolation='nearest')
+            plt.plot(poses, np.zeros(len(poses)), 'g-', linewidth=2)
+            plt.xlabel('x (m)')
+            plt.ylabel('y (m)')
         else:
-            plt.plot([x for x, _ in arr], [y for _, y in arr],
-                                 'o', linewidth=2)
-            plt.plot([x for x, _ in pose_arr], [y for _, y in pose_arr],
-                                 'go', linewidth=2)
+            x, y = laser_points(scans, poses)
+            plt.plot(x, y, 'o', linewidth=2)
+            plt.plot(poses, np.zeros(len(poses)), 'go', linewidth=2)
             plt.axes().set_aspect('equal', 'datalim')
-        plt.show()
-                    
+        if save is None:
+            plt.show()
+        else:
+            plt.savefig(save, dpi=150)
 
         print('Total distance %.2fm' % (total_dist_raw * 6.465/400.0))
 
@@ -129,8 +171,20 @@ if __name__ == '__main__':
     parser.add_argument('filename', help='logfile')
     parser.add_argument('--verbose', '-v', action='store_true', help='print intermediate output')
     parser.add_argument('--gyro', action='store_true', help='show gyro data')
+    parser.add_argument('--grid', type=float, dest='grid_resolution',
+                        help='show laser hit count grid with given cell size in meters')
+    parser.add_argument('--save', help='save image (e.g. PNG) instead of showing window')
+    parser.add_argument('--follow', '-f', action='store_true',
+                        help='show laser of running robot as the log grows')
     args = parser.parse_args()
 
-    parse(args.filename, verbose=args.verbose, gyro_output=args.gyro)
+    if args.follow:
+        try:
+            follow(args.filename)
+        except KeyboardInterrupt:
+            pass
+        sys.exit()
+    parse(args.filename, verbose=args.verbose, gyro_output=args.gyro,
+          grid_resolution=args.grid_resolution, save=args.save)
 
 # vim: expandtab sw=4 ts=4
@@ -0,0 +1,117 @@
+"""
+  Index of TAG:<name>:BEGIN/END annotations and extraction of a segment or
+  time window into standalone log. The robot code does not start in the
+  middle of a run, so the slices replay only with replay.py --force
+  (or myr2017.py --replay ... --force).
+  usage:
+     python logslice.py <log file>
+     python logslice.py <log file> --segment enter_field [--occurrence 1] [--margin 2]
+     python logslice.py <log file> --start 120 --end 180
+"""
+
+import argparse
+from datetime import timedelta
+
+from logger import LogWriter, LogReader, LogEnd
+
+
+ANNOT_STREAM = 0
+
+
+def segments(log):
+    """
+    return list of (name, begin, end) of tagged segments in order of BEGIN,
+    end is None for unfinished segment, only annotation records are read
+    """
+    ret = []
+    running = {}  # name: indices of unfinished segments
+    for dt, __, data in log.iter_stream(ANNOT_STREAM):
+        tag = bytes(data).split(b':')
+        if len(tag) != 3 or tag[0] != b'TAG':
+            continue
+        name = tag[1].decode('utf-8', 'replace')
+        if tag[2] == b'BEGIN':
+            running.setdefault(name, []).append(len(ret))
+            ret.append([name, dt, None])
+        elif tag[2] == b'END' and len(running.get(name, [])) > 0:
+            ret[running[name].pop()][2] = dt
+    return [tuple(segment) for segment in ret]
+
+
+def find_segment(log, name, occurrence=0):
+    "return (begin, end) of given occurrence of segment"
+    found = [(begin, end) for segment_name, begin, end in segments(log) if segment_name == name]
+    if not 0 <= occurrence < len(found):
+        raise ValueError('segment %s occurrence %d not found, the log has %d'
+                         % (name, occurrence, len(found)))
+    return found[occurrence]
+
+
+def slice_log(log, start, end=None, prefix='slice'):
+    """
+    copy records of all streams from start to end (timedelta, None = till the end)
+    into new log and return its filename, time of copied records starts from zero,
+    existing file raises FileExistsError
+    """
+    start = max(start, timedelta())
+    log.seek(start)  # only headers are scanned
+    version = min(log.version, 1)  # slices are small, compressed logs are stored uncompressed
+    with LogWriter(prefix=prefix, version=version, start_time=log.start_time + start,
+                   overwrite=False) as out:
+        note = 'slice of %s from %s to %s' % (log.filename, start, end)
+        out.write_record(timedelta(), ANNOT_STREAM, bytes(note, encoding='utf-8'))
+        while True:
+            try:
+                dt, stream_id, data = log.read()
+            except LogEnd:
+                break
+            if end is not None and dt > end:
+                break
+            out.write_record(dt - start, stream_id, data)
+    return out.filename
+
+
+def print_segments(log):
+    occurrences = {}
+    for name, begin, end in segments(log):
+        occurrence = occurrences.get(name, 0)
+        occurrences[name] = occurrence + 1
+        duration = '%8.3fs' % (end - begin).total_seconds() if end is not None else 'unfinished'
+        print('%-24s %3d %16s %16s %s' % (name, occurrence, begin, end, duration))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='List tagged segments and extract them into new log')
+    parser.add_argument('filename', help='logfile')
+    parser.add_argument('--segment', help='extract segment of given tag name')
+    parser.add_argument('--occurrence', type=int, default=0, help='which occurrence of the segment')
+    parser.add_argument('--start', type=float, help='extract time window from start (seconds)')
+    parser.add_argument('--end', type=float, help='end of the time window (seconds)')
+    parser.add_argument('--margin', type=float, default=0.0,
+                        help='extend extracted segment by seconds on both sides')
+    parser.add_argument('--prefix', default='slice', help='prefix of new log file')
+    args = parser.parse_args()
+
+    with LogReader(args.filename) as log:
+        if args.segment is None and args.start is None and args.end is None:
+            print_segments(log)
+        else:
+            if args.segment is not None:
+                try:
+                    start, end = find_segment(log, args.segment, args.occurrence)
+                except ValueError as e:
+                    parser.error(str(e))
+            else:
+                start = timedelta(seconds=args.start or 0.0)
+                end = None if args.end is None else timedelta(seconds=args.end)
+            margin = timedelta(seconds=args.margin)
+            start -= margin
+            if end is not None:
+                end += margin
+            try:
+                print(slice_log(log, start, end, prefix=args.prefix))
+            except FileExistsError as e:
+                parser.error('%s exists, use another --prefix' % e.filename)
+            print('replay it with --force')
+
+# vim: expandtab sw=4 ts=4
@@ -1,16 +1,26 @@
 # the simplest MYR2017 version
 
 import argparse
+import contextlib
 import socket
 import sys
 import struct
-import itertools
 import zlib
 from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Empty, Full
 from threading import Thread
 
-from logger import LogWriter, LogReader, LogEnd
+import numpy as np
+
+from logger import LogWriter, BufferedLogWriter, LaneLogWriter, CompressedLogWriter, LogReader, LogEnd
+from naio import NaioDecoder
+from latency import LatencyMonitor
+from diagnostics import Diagnostics, print_message
+from ingress import SocketIngress
+from compression import AdaptiveCompression
 from robot import Robot
+from transport import AsyncTransport
 
 DEFAULT_HOST = '127.0.0.1'    # The remote host
 DEFAULT_PORT = 5559              # The same port as used by the server
@@ -19,14 +29,34 @@ ANNOT_STREAM = 0  # the same as debug/info
 INPUT_STREAM = 1
 OUTPUT_STREAM = 2
 VIDEO_STREAM = 3
+LATENCY_STREAM = 4  # JSON with control loop latency histograms
+
+LATENCY_PERIOD = 10.0  # seconds between latency records
+
+LOG_VERSION = 1  # 64bit time and 32bit record size
+COMPRESSED_LOG_VERSION = 2  # ver1 records in compressed blocks
+LOG_WRITERS = {'sync': LogWriter, 'buffered': BufferedLogWriter, 'lanes': LaneLogWriter,
+               'compressed': CompressedLogWriter}
+
+VIDEO_COMPRESSION_LEVELS = [(2, 7), (4, 3), (8, 1)]  # (backlog limit, zlib level), then 0
+VIDEO_COMPRESSION_WORKERS = 2
+VIDEO_MAX_BACKLOG = 16  # chunks waiting for compression, the oldest is dropped over it
+VIDEO_CHUNK_SIZE = 0x80000  # raw video bytes per log record (ver1 only)
+VIDEO_GAP = b''  # empty video record replaces dropped chunks, the split frame is discarded
+INPUT_BATCH_SIZE = 0x10000  # max robot input bytes per log record, ver0 is limited to 0xFFFF
 
-VIDEO_COMPRESSION_LEVEL = 7  # zlib parameter
+DIAGNOSTICS_OUTPUTS = ['terminal', 'log']  # log = annotation stream
 
 # Row navigation constants
 MAX_GAP_SIZE = 13  # defined for plants on both sides
 OPEN_SIZE = 17
 OFFSET_SIZE = 5
 END_OF_ROW_SIZE = 18 + 19  # for 180deg FOV
+NEAR_LIMIT = 1.0  # meters, obstacle distance for gaps
+FAR_LIMIT = 1.5  # meters, further radius to ignore corrections on the same object
+
+
+diag = print_message  # diagnostic output of the control code, see start_diagnostics()
 
 
 class WrapperIO:
@@ -34,24 +64,38 @@ class WrapperIO:
         self.soc = soc
         self.log = log
         self.ignore_ref_output = ignore_ref_output
-        self.buf = b''
+        self.decoder = NaioDecoder()
         self.time = None
+        self.ingress = None
+        if isinstance(soc, socket.socket):
+            self.ingress = SocketIngress(soc, INPUT_BATCH_SIZE if log.version > 0 else 0xFFFF)
+        # replay comparison with recorded motor commands
+        self.num_outputs = 0
+        self.num_matching = 0
+        self.first_divergence = None
 
     def get(self):
-        if len(self.buf) < 1024:
-            if self.soc is None:
-                self.time, __, data = self.log.read(INPUT_STREAM)
-            else:
-                data = self.soc.recv(1024)
-                self.time = self.log.write(INPUT_STREAM, data)
-            self.buf += data
-
-        assert len(self.buf) > 7 and self.buf[:6] == b'NAIO01', self.buf
-        msg_id = self.buf[6]
-        size = struct.unpack('>I', self.buf[7:7+4])[0]
-        data = self.buf[11:11+size]
-        self.buf = self.buf[11+size+4:]  # cut CRC32
-        return self.time, msg_id, data
+        # the same read ahead policy is required for live run and replay,
+        # every read_input() is exactly one log record
+        if len(self.decoder) < 1024:
+            self.decoder.feed(self.read_input())
+        frame = self.decoder.next_frame()
+        while frame is None:
+            # frame split over several inputs
+            self.decoder.feed(self.read_input())
+            frame = self.decoder.next_frame()
+        msg_id, data = frame
+        return self.time, msg_id, bytes(data)
+
+    def read_input(self):
+        if self.soc is None:
+            self.time, __, data = self.log.read(INPUT_STREAM)
+        else:
+            data = self.ingress.read()  # all received data, valid till the next read
+            if len(data) == 0:
+                raise ConnectionError('robot connection closed')
+            self.time = self.log.write(INPUT_STREAM, data)
+        return data
 
     def put(self, cmd):
         msg_id, data = cmd
@@ -60,35 +104,80 @@ class WrapperIO:
             ref = self.log.read(OUTPUT_STREAM)[2]
             if not self.ignore_ref_output:
                 assert naio_msg == ref, (naio_msg, ref)
+            self.num_outputs += 1
+            if naio_msg == ref:
+                self.num_matching += 1
+            elif self.first_divergence is None:
+                self.first_divergence = self.time
         else:
-            self.log.write(OUTPUT_STREAM, naio_msg)
-            self.soc.sendall(naio_msg)
+            self.send(naio_msg)
+
+    def send(self, naio_msg):
+        self.log.write(OUTPUT_STREAM, naio_msg)
+        self.soc.sendall(naio_msg)
 
     def annot(self, annotation):
+        self.log_write(ANNOT_STREAM, annotation)
+
+    def log_write(self, stream_id, data):
+        "extra log data - ignored in replay"
         if self.soc is not None:
-            self.log.write(ANNOT_STREAM, annotation)
+            self.log.write(stream_id, data)
 
 
-def laser2ascii(scan, limit = 1.0):
+class AsyncWrapperIO(WrapperIO):
+    """
+    WrapperIO over AsyncTransport, robot input and motor commands are logged
+    here in the order of consumption (as by WrapperIO) so the log replays,
+    the rest of logging is done by the transport
+    """
+    def __init__(self, transport, log):
+        super().__init__(transport, log)
+
+    def read_input(self):
+        data = self.soc.read_input()
+        self.time = self.log.write(INPUT_STREAM, data)
+        return data
+
+    def send(self, naio_msg):
+        self.log.write(OUTPUT_STREAM, naio_msg)
+        self.soc.send(naio_msg)
+
+    def log_write(self, stream_id, data):
+        self.soc.log_write(stream_id, data)
+
+
+def laser_sectors(scan, step=5):
+    "minimal distance in meters for each group of step readings (0 = no reflection)"
+    arr = np.array(scan, dtype=np.float64)
+    arr[arr == 0] = 10000
+    return np.minimum.reduceat(arr, np.arange(0, len(arr), step)) / 1000.0
+
+
+def free_gaps(sectors, limits):
+    "return list of (left, right) free sectors around the center for each distance limit"
+    mid = len(sectors) // 2
+    blocked = sectors[np.newaxis, :] <= np.asarray(limits, dtype=np.float64)[:, np.newaxis]
+
+    left_part = blocked[:, mid:0:-1]  # from center to the left, sector 0 excluded
+    left = np.where(left_part.any(axis=1), np.argmax(left_part, axis=1), mid)
+
+    right_part = blocked[:, mid:]
+    right = np.where(right_part.any(axis=1), np.argmax(right_part, axis=1), len(sectors) - mid)
+    return list(zip(left.tolist(), right.tolist()))
+
+
+def sectors2ascii(sectors):
     "Eduro ASCII art"
-    step = 5
-    scan2 = [x == 0 and 10000 or x for x in scan]
-    min_dist_arr = [min(i)/1000.0 for i in 
-                        [itertools.islice(scan2, start, start + step) 
-                            for start in range(0, len(scan2), step)]]
-    s = ''
-    for d in min_dist_arr:
-        s += (d < 0.5 and 'X' or (d<1.0 and 'x' or (d<1.5 and '.' or ' ')))
-    mid = int(len(s)/2)
-    s = s[:mid] + 'C' + s[mid:]
-
-    left, right = mid, mid
-    while left > 0 and min_dist_arr[left] > limit:
-        left -= 1
-    while right < len(min_dist_arr) and min_dist_arr[right] > limit:
-        right += 1
-
-    return s, mid-left, right-mid
+    s = ''.join([d < 0.5 and 'X' or (d<1.0 and 'x' or (d<1.5 and '.' or ' ')) for d in sectors])
+    mid = len(s) // 2
+    return s[:mid] + 'C' + s[mid:]
+
+
+def laser2ascii(scan, limit = 1.0):
+    sectors = laser_sectors(scan)
+    left, right = free_gaps(sectors, [limit])[0]
+    return sectors2ascii(sectors), left, right
 
 
 def move_straight(robot, how_far):
@@ -133,7 +222,7 @@ def turn_deg(robot, angle_deg):
         if abs(angle) > abs(angle_deg):  # TODO lower threshold for minor corrections
             break
     robot.stop()
-    print('gyro_sum', gyro_sum, robot.time - start_time, num_updates)
+    diag('gyro_sum %d %s %d', gyro_sum, robot.time - start_time, num_updates)
 
 
 def turn_right_90deg(robot):
@@ -151,7 +240,7 @@ def turn_left_90deg(robot):
 def enter_field(robot, verbose):
     robot.annot(b'TAG:enter_field:BEGIN')
     if verbose:
-        print('enter_field')
+        diag('enter_field')
     if robot.time is None:
         robot.update()
 
@@ -159,13 +248,12 @@ def enter_field(robot, verbose):
     start_time = robot.time
     while robot.time - start_time < timedelta(minutes=1):        
         robot.update()
-        triplet = laser2ascii(robot.laser)
-        s, left, right = triplet
+        left, right = free_gaps(laser_sectors(robot.laser), [NEAR_LIMIT])[0]
         if left + right < END_OF_ROW_SIZE:
             # i.e. there is some obstacle within 1 meter radius
             break
         if verbose:
-            print('max_dist', max(robot.laser))
+            diag('max_dist %d', max(robot.laser))
 
     robot.stop()
     robot.update()
@@ -183,11 +271,8 @@ def navigate_row(robot, verbose):
 
     while not end_of_row:
         robot.update()
-        max_dist = max(robot.laser)
-        triplet = laser2ascii(robot.laser)
-        s, left, right = triplet
-
-        __, left2, right2 = laser2ascii(robot.laser, limit=1.5)
+        sectors = laser_sectors(robot.laser)
+        (left, right), (left2, right2) = free_gaps(sectors, [NEAR_LIMIT, FAR_LIMIT])
 
         if left + right < MAX_GAP_SIZE:
             if left < right:
@@ -219,7 +304,7 @@ def navigate_row(robot, verbose):
                 robot.move_forward()
 
         if verbose:
-            print('%4d' % max_dist, triplet, (left2, right2))
+            diag('%4d %s %s', max(robot.laser), (sectors2ascii(sectors), left, right), (left2, right2))
         if left + right >= END_OF_ROW_SIZE:
             end_of_row = True
 
@@ -247,32 +332,158 @@ def connect(host, port):
 
 
 class VideoRecorder(Thread):
-
-    def __init__(self, soc, log):
+    """
+    Receive video data and log them compressed. The compression runs in
+    worker pool and its level drops with growing backlog, down to stored
+    (level 0) data, so the receiver never waits for it. If even the storing
+    falls behind, the oldest waiting chunk is dropped and VIDEO_GAP is
+    logged in its place. Failure of the log writer stops the recording.
+    """
+    def __init__(self, soc, log, workers=VIDEO_COMPRESSION_WORKERS):
         Thread.__init__(self)
         self.setDaemon(True)
         self.soc = soc
         self.log = log
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        # (compression future, level, number of frames, chunk index) in the order of receiving
+        self.pending = Queue(maxsize=VIDEO_MAX_BACKLOG)
+        self.writer = Thread(target=self.write_loop, daemon=True)
+        self.compression = AdaptiveCompression(VIDEO_COMPRESSION_LEVELS)
+        self.error = None  # exception of the writer thread
+
+    def submit(self, data):
+        index = self.compression.chunks_received
+        level, num_frames = self.compression.received(data, self.pending.qsize())
+        if self.error is not None:
+            self.compression.dropped(num_frames)
+            return
+        item = (self.pool.submit(zlib.compress, data, level), level, num_frames, index)
+        while True:
+            try:
+                self.pending.put_nowait(item)
+                break
+            except Full:
+                self.drop_oldest()
+
+    def drop_oldest(self):
+        try:
+            future, __, num_frames, __ = self.pending.get_nowait()
+        except Empty:
+            return  # just taken by the writer
+        future.cancel()
+        self.compression.dropped(num_frames)
+
+    def write_loop(self):
+        next_index = 0
+        try:
+            while True:
+                item = self.pending.get()
+                if item is None:
+                    break
+                future, level, num_frames, index = item
+                data = future.result()
+                if index != next_index:
+                    self.log.write(VIDEO_STREAM, VIDEO_GAP)
+                self.log.write(VIDEO_STREAM, data)
+                self.compression.written(data, level, num_frames)
+                next_index = index + 1
+        except Exception as e:
+            self.error = e
+            print('Video writer failed', e)
 
     def run(self):
         print('Video Recorder started')
+        self.writer.start()
+        # ver0 log records are limited to 64KB
+        chunk_size = 10000 if self.log.version == 0 else VIDEO_CHUNK_SIZE
+        buf = bytearray()
         while True:
             try:
-                data = self.soc.recv(10000)
+                data = self.soc.recv(min(chunk_size - len(buf), 0x10000))
             except:
                 print('Video Terminated')
                 break
-            # maybe compression could be part of LogWriter??
-            self.log.write(VIDEO_STREAM, zlib.compress(data, VIDEO_COMPRESSION_LEVEL))
+            if len(data) == 0:
+                print('Video Terminated')
+                break
+            buf += data
+            if len(buf) >= chunk_size:
+                self.submit(bytes(buf))
+                buf.clear()
+        if len(buf) > 0:
+            self.submit(bytes(buf))
+        while self.writer.is_alive():
+            try:
+                self.pending.put(None, timeout=0.1)
+                break
+            except Full:
+                pass  # writer is blocked by the log
+        self.writer.join()
+        self.pool.shutdown()
+
+    @property
+    def stats(self):
+        return self.compression.stats(self.pending.qsize())
+
+
+def start_diagnostics(output, io):
+    "route diag() of the control code to background writer, return it for closing"
+    global diag
+    if output == 'log':
+        diag = Diagnostics(write=lambda text: io.annot(bytes(text, encoding='utf-8')))
+    else:
+        assert output == 'terminal', output
+        diag = Diagnostics()
+    return diag
+
+
+def stop_diagnostics(diagnostics):
+    global diag
+    diag = print_message
+    diagnostics.close()
+    if diagnostics.merged + diagnostics.dropped + diagnostics.errors > 0:
+        print('diagnostics stats', diagnostics.stats)
+
+
+def create_log(log_writer):
+    "new log written by writer of given name"
+    log_class = LOG_WRITERS[log_writer]
+    version = COMPRESSED_LOG_VERSION if log_class is CompressedLogWriter else LOG_VERSION
+    return log_class(note=str(sys.argv), version=version)
+
+
+def main(host, port, video_port=None, log_writer=None, use_asyncio=False, telemetry=None,
+         diagnostics='terminal'):
+    """
+    log_writer defaults to lanes for asyncio, so the control loop never waits
+    for video writes, and to sync otherwise,
+    telemetry is optional name of shared memory with the latest robot state,
+    diagnostics is output of diagnostic messages (terminal or log)
+    """
+    if log_writer is None:
+        log_writer = 'lanes' if use_asyncio else 'sync'
+    with contextlib.ExitStack() as stack:
+        publisher = None
+        if telemetry is not None:
+            from telemetry import TelemetryPublisher
+            publisher = stack.enter_context(TelemetryPublisher(telemetry))
+            print('telemetry', publisher.name)
+        if use_asyncio:
+            yield from main_asyncio(host, port, video_port, log_writer, publisher, diagnostics)
+        else:
+            yield from main_sockets(host, port, video_port, log_writer, publisher, diagnostics)
 
 
-def main(host, port, video_port=None):
+def main_sockets(host, port, video_port=None, log_writer='sync', telemetry=None,
+                 diagnostics='terminal'):
+    "robot and video sockets served by threads"
+
     s = connect(host, port)
     video_socket = None
     if video_port is not None:
         video_socket = connect(host, video_port)
 
-    with s, LogWriter(note=str(sys.argv)) as log:
+    with s, create_log(log_writer) as log:
         print(log.filename)
         io = WrapperIO(s, log)
         
@@ -281,12 +492,52 @@ def main(host, port, video_port=None):
             recorder = VideoRecorder(video_socket, log)
             recorder.start()
 
-        yield Robot(io.get, io.put, io.annot)
+        latency = LatencyMonitor(write=lambda data: io.log_write(LATENCY_STREAM, data),
+                                 period=LATENCY_PERIOD)
+        diagnostics = start_diagnostics(diagnostics, io)
+        try:
+            yield Robot(io.get, io.put, io.annot, latency=latency, telemetry=telemetry)
+        finally:
+            stop_diagnostics(diagnostics)
         print(log.filename)
+        print(latency.summary())
 
         if video_socket is not None:
             video_socket.close()
             recorder.join()
+            print('video stats', recorder.stats)
+
+        print('ingress stats', io.ingress.stats)
+        print('log stats', log.stats)  # write_wait_2 = motor commands
+
+
+def main_asyncio(host, port, video_port=None, log_writer='lanes', telemetry=None,
+                 diagnostics='terminal'):
+    "robot and video sockets served by asyncio event loop"
+    with create_log(log_writer) as log:
+        print(log.filename)
+        transport = AsyncTransport(log, video_chunk_size=VIDEO_CHUNK_SIZE,
+                                   compression_levels=VIDEO_COMPRESSION_LEVELS,
+                                   max_backlog=VIDEO_MAX_BACKLOG,
+                                   workers=VIDEO_COMPRESSION_WORKERS)
+        transport.start(host, port, video_port)
+        try:
+            io = AsyncWrapperIO(transport, log)
+            latency = LatencyMonitor(write=lambda data: io.log_write(LATENCY_STREAM, data),
+                                     period=LATENCY_PERIOD)
+            diagnostics = start_diagnostics(diagnostics, io)
+            try:
+                yield Robot(io.get, io.put, io.annot, latency=latency, telemetry=telemetry)
+            finally:
+                stop_diagnostics(diagnostics)  # pending annotations go to the transport
+            print(latency.summary())  # the last record is written before closing
+        finally:
+            transport.close()
+        print(log.filename)
+
+        if video_port is not None:
+            print('video stats', transport.video_stats)
+        print('log stats', log.stats)  # write_wait_2 = motor commands
 
 
 def main_replay(filename, force):
@@ -386,6 +637,18 @@ if __name__ == '__main__':
     parser.add_argument('--video-port', dest='video_port',
                         help='optional video port 5558 for simulator, default "no video"')
 
+    parser.add_argument('--log-writer', dest='log_writer',
+                        choices=sorted(LOG_WRITERS.keys()),
+                        help='buffered, lanes and compressed writers write log in background '
+                             'thread, compressed stores zlib compressed blocks '
+                             '(default sync, lanes with --asyncio)')
+    parser.add_argument('--asyncio', dest='use_asyncio', action='store_true',
+                        help='serve sockets and logging by asyncio event loop')
+    parser.add_argument('--telemetry', nargs='?', const='myr2017',
+                        help='publish robot state in shared memory of given name')
+    parser.add_argument('--diagnostics', default='terminal', choices=DIAGNOSTICS_OUTPUTS,
+                        help='write diagnostic messages to terminal or log annotations')
+
     parser.add_argument('--replay', help='replay existing log file')
     parser.add_argument('--force', '-F', dest='force', action='store_true',
                         help='force replay even for failing output asserts')
@@ -394,7 +657,9 @@ if __name__ == '__main__':
     args = parser.parse_args()
     
     if args.replay is None:
-        for robot in main(args.host, args.port, args.video_port):
+        for robot in main(args.host, args.port, args.video_port, log_writer=args.log_writer,
+                          use_asyncio=args.use_asyncio, telemetry=args.telemetry,
+                          diagnostics=args.diagnostics):
             run_robot(robot, test_case=args.test_case, verbose=args.verbose)
     else:
         for robot in main_replay(args.replay, args.force):
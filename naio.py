@@ -0,0 +1,101 @@
+"""
+  Incremental decoder of NAIO01 frames
+"""
+
+import struct
+import zlib
+
+
+NAIO_MAGIC = b'NAIO01'
+HEADER_SIZE = 6 + 1 + 4  # NAIO01, type, size
+WRAP_SIZE = HEADER_SIZE + 4  # + CRC32
+MAX_FRAME_SIZE = 0x400000  # larger size means corrupted header
+
+SIZE_STRUCT = struct.Struct('>I')
+
+
+def naio_frame(msg_id, data, crc=None):
+    "wrap data into NAIO01 frame, CRC32 is computed if not given"
+    frame = NAIO_MAGIC + bytes([msg_id]) + SIZE_STRUCT.pack(len(data)) + bytes(data)
+    if crc is None:
+        crc = zlib.crc32(frame)
+    return frame + SIZE_STRUCT.pack(crc)
+
+
+class NaioDecoder:
+    """
+    Feed it with received bytes and take complete frames as (msg_id, payload).
+    The payload is memoryview valid as long as it is referenced.
+    """
+    def __init__(self, check_crc=False, max_size=MAX_FRAME_SIZE):
+        self.check_crc = check_crc
+        self.max_size = max_size
+        self.buf = bytearray()
+        self.pos = 0  # start of unprocessed data
+        self.num_frames = 0
+        self.bad_frames = 0
+        self.skipped_bytes = 0
+
+    def __len__(self):
+        "number of buffered bytes"
+        return len(self.buf) - self.pos
+
+    def feed(self, data):
+        if self.pos > 0 and 2 * self.pos >= len(self.buf):
+            try:
+                del self.buf[:self.pos]
+            except BufferError:
+                # some payload is still referenced - keep it and start new buffer
+                self.buf = self.buf[self.pos:]
+            self.pos = 0
+        try:
+            self.buf += data
+        except BufferError:
+            self.buf = self.buf + data
+
+    def next_frame(self):
+        "return (msg_id, payload) or None if more data are needed"
+        buf = self.buf
+        while len(buf) - self.pos >= WRAP_SIZE:
+            pos = self.pos
+            if not buf.startswith(NAIO_MAGIC, pos):
+                self.resync()
+                continue
+            size = SIZE_STRUCT.unpack_from(buf, pos + 7)[0]
+            if size > self.max_size:
+                self.resync()
+                continue
+            end = pos + HEADER_SIZE + size
+            if len(buf) < end + 4:
+                return None
+            if self.check_crc:
+                if zlib.crc32(memoryview(buf)[pos:end]) != SIZE_STRUCT.unpack_from(buf, end)[0]:
+                    self.resync()
+                    continue
+            self.pos = end + 4
+            self.num_frames += 1
+            return buf[pos + 6], memoryview(buf)[pos + HEADER_SIZE:end]
+        return None
+
+    def frames(self):
+        "yield all complete frames"
+        while True:
+            frame = self.next_frame()
+            if frame is None:
+                break
+            yield frame
+
+    def resync(self):
+        "skip corrupted data up to the next NAIO01 magic"
+        i = self.buf.find(NAIO_MAGIC, self.pos + 1)
+        if i < 0:
+            # keep tail which could be beginning of the magic
+            i = max(self.pos + 1, len(self.buf) - len(NAIO_MAGIC) + 1)
+        self.bad_frames += 1
+        self.skip(i - self.pos)
+
+    def skip(self, size):
+        self.pos += size
+        self.skipped_bytes += size
+
+# vim: expandtab sw=4 ts=4
@@ -1,51 +1,85 @@
 """
   Play recorded video
   usage:
-     python play_video.py <log file>
+     python play_video.py <log file> [--start SEC] [--end SEC] [--every N]
 """
 
-import sys
-import struct
+import argparse
 import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 
 from logger import LogReader, LogEnd
+from naio import NaioDecoder
 
 
 VIDEO_STREAM = 3
-WRAP_SIZE = 6 + 1 + 4 + 4  # NAIO01, type, size + CRC32
+IMAGE_HEADER_SIZE = 5
+IMAGE_SIZE = 752*480*2
+VIDEO_GAP = b''  # dropped chunks, see myr2017.VideoRecorder
 
 
-def play_video(filename):
-    with LogReader(filename) as log:
-        buf = b''
-        num_images = 0
-        while True:
-            try:
-                data = log.read(VIDEO_STREAM)[2]
-            except LogEnd:
+def video_frames(log, start=None, end=None):
+    "yield (time, image) from video stream, image is memoryview of raw data"
+    if start is not None:
+        log.seek(start)  # decoder skips partial frame up to next NAIO01 header
+    decoder = NaioDecoder()
+    while True:
+        try:
+            dt, __, data = log.read(VIDEO_STREAM)
+        except LogEnd:
+            break
+        if end is not None and dt > end:
+            break
+        if data == VIDEO_GAP:
+            decoder = NaioDecoder()  # frame split by the gap is lost, resync on next header
+            continue
+        decoder.feed(zlib.decompress(data))  # every record is independent zlib stream
+        for __, payload in decoder.frames():
+            yield dt, payload[IMAGE_HEADER_SIZE:]
+
+
+def write_pgm(filename, image):
+    assert len(image) == IMAGE_SIZE, len(image)
+    with open(filename, 'wb') as f:
+        f.write(b'P5\n752 960\n255\n')
+        f.write(image)
+
+
+def play_video(filename, start=None, end=None, first=0, last=None, every=1, jobs=4):
+    "save selected frames as PGM images, return number of saved images"
+    num_images = 0
+    with LogReader(filename) as log, ThreadPoolExecutor(max_workers=jobs) as pool:
+        pending = []
+        for index, (dt, image) in enumerate(video_frames(log, start=start, end=end)):
+            if last is not None and index > last:
                 break
-            buf += zlib.decompress(data)
-            if len(buf) > 10:
-                prefix = buf[:6]
-                assert prefix == b'NAIO01', prefix
-                size = struct.unpack_from('>I', buf, 6+1)[0]
-                if len(buf) >= size + WRAP_SIZE:
-                    image = buf[:size + WRAP_SIZE]
-                    print('image', len(image))
-                    image = image[11+5:-4]  # remove header and CRC32
-                    assert len(image) == 752*480*2, len(image)
-                    f = open('image_%03d.pgm' % num_images, 'wb')
-                    f.write(b'P5\n752 960\n255\n')
-                    f.write(image)
-                    f.close()
-                    num_images += 1
-                    buf = buf[size + WRAP_SIZE:]
+            if index < first or (index - first) % every != 0:
+                continue
+            print('image', index, dt)
+            pending.append(pool.submit(write_pgm, 'image_%03d.pgm' % index, image))
+            if len(pending) > 2 * jobs:
+                pending.pop(0).result()
+            num_images += 1
+        for future in pending:
+            future.result()
+    return num_images
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print(__doc__)
-        sys.exit(-1)
-    play_video(sys.argv[1])
+    parser = argparse.ArgumentParser(description='Extract recorded video frames as PGM images')
+    parser.add_argument('filename', help='logfile')
+    parser.add_argument('--start', type=float, help='start time in seconds')
+    parser.add_argument('--end', type=float, help='end time in seconds')
+    parser.add_argument('--first', type=int, default=0, help='first frame (counted from start)')
+    parser.add_argument('--last', type=int, help='last frame (counted from start)')
+    parser.add_argument('--every', type=int, default=1, help='save every N-th frame')
+    parser.add_argument('--jobs', '-j', type=int, default=4, help='number of writer threads')
+    args = parser.parse_args()
+
+    start = None if args.start is None else timedelta(seconds=args.start)
+    end = None if args.end is None else timedelta(seconds=args.end)
+    play_video(args.filename, start=start, end=end, first=args.first, last=args.last,
+               every=args.every, jobs=args.jobs)
 
 # vim: expandtab sw=4 ts=4
@@ -0,0 +1,119 @@
+"""
+  Headless replay of recorded run with throughput report
+  usage:
+     python replay.py <log file> [--test TEST] [--speed 2] [--step] [--force]
+"""
+
+import argparse
+import time
+
+import myr2017
+from logger import open_log, LogEnd
+from robot import Robot
+from myr2017 import WrapperIO, run_robot
+
+
+class ReplayIO(WrapperIO):
+    """
+    Replay input with optional pacing - speed 1.0 is real time, None is
+    as fast as possible. With step=True it waits for Enter after every
+    control cycle.
+    """
+    def __init__(self, log, ignore_ref_output=False, speed=None, step=False):
+        if speed is not None and speed <= 0:
+            raise ValueError('speed must be positive, use None for unlimited')
+        super().__init__(None, log, ignore_ref_output=ignore_ref_output)
+        self.speed = speed
+        self.step = step
+        self.num_messages = 0
+        self.num_cycles = 0
+        self.start_time = None
+
+    def get(self):
+        ret = super().get()
+        self.num_messages += 1
+        return ret
+
+    def put(self, cmd):
+        super().put(cmd)
+        self.num_cycles += 1
+        if self.speed is not None:
+            if self.start_time is None:
+                self.start_time = time.monotonic() - self.time.total_seconds() / self.speed
+            delay = self.start_time + self.time.total_seconds() / self.speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        if self.step:
+            input('%s %s > ' % (self.time, cmd[1].hex()))
+
+
+def no_message(message, *args):
+    "diagnostics of the control code are not shown"
+    pass
+
+
+def replay(filename, test_case=None, force=False, speed=None, step=False, verbose=False):
+    """
+    run robot code against the log and return dict of throughput statistics,
+    diagnostic messages of the control code are shown only if verbose or step
+    """
+    with open_log(filename) as log:
+        io = ReplayIO(log, ignore_ref_output=force, speed=speed, step=step)
+        robot = Robot(io.get, io.put, io.annot)
+        diag = myr2017.diag
+        if not (verbose or step):
+            myr2017.diag = no_message
+        start = time.perf_counter()
+        try:
+            run_robot(robot, verbose=verbose, test_case=test_case)
+        except LogEnd:
+            pass
+        finally:
+            myr2017.diag = diag
+        duration = time.perf_counter() - start
+
+    sim_time = io.time.total_seconds() if io.time is not None else 0.0
+    return {
+        'messages': io.num_messages,
+        'cycles': io.num_cycles,
+        'duration': duration,
+        'sim_time': sim_time,
+        'messages_per_sec': io.num_messages / duration,
+        'cycles_per_sec': io.num_cycles / duration,
+        'realtime_factor': sim_time / duration,
+        'outputs': io.num_outputs,
+        'matching': io.num_matching,
+        'match_ratio': io.num_matching / io.num_outputs if io.num_outputs > 0 else None,
+        'first_divergence': None if io.first_divergence is None else io.first_divergence.total_seconds(),
+    }
+
+
+def positive_float(text):
+    value = float(text)
+    if value <= 0:
+        raise argparse.ArgumentTypeError('must be positive, omit it for unlimited')
+    return value
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay log file as fast as possible')
+    parser.add_argument('filename', help='logfile')
+    parser.add_argument('--test', dest='test_case', help='test cases',
+                        choices=['1m', '90deg', 'loops', 'enter'])
+    parser.add_argument('--force', '-F', dest='force', action='store_true',
+                        help='force replay even for failing output asserts')
+    parser.add_argument('--speed', type=positive_float,
+                        help='real time pacing factor (default unlimited)')
+    parser.add_argument('--step', action='store_true', help='wait for Enter after every control cycle')
+    parser.add_argument('--verbose', action='store_true', help='show diagnostics of the robot code')
+    args = parser.parse_args()
+
+    stats = replay(args.filename, test_case=args.test_case, force=args.force,
+                   speed=args.speed, step=args.step, verbose=args.verbose)
+    print('%(messages)d messages, %(cycles)d cycles in %(duration).3fs' % stats)
+    print('%(messages_per_sec).0f messages/s, %(cycles_per_sec).0f cycles/s, '
+          '%(realtime_factor).1fx real time' % stats)
+    print('%(matching)d of %(outputs)d motor commands match, first divergence at %(first_divergence)s s'
+          % stats)
+
+# vim: expandtab sw=4 ts=4
@@ -1,45 +1,102 @@
 # a robot with put/get items interface
 
 import struct
+from time import perf_counter
 
 
 MOTOR_ID = 0x01
 ODOMETRY_ID = 0x06
 LASER_ID = 0x07
+GPS_ID = 0x08
+ACCELEROMETER_ID = 0x09
 GYRO_ID = 0x0A
+MAGNETOMETER_ID = 0x0B
+
+LASER_STRUCT = struct.Struct('>271H271x')  # distances in mm, intensities are skipped
+ODOMETRY_STRUCT = struct.Struct('4B')  # FR, RR, RL, FL
+IMU_STRUCT = struct.Struct('>hhh')  # X, Y, Z
 
 
 class Robot:
-    def __init__(self, get, put, annot=None, term=LASER_ID):
-        "provide input and output methods"
+    __slots__ = ('get', 'put', 'term', '_annot', 'latency', 'telemetry', 'update_end', 'decoders',
+                 'msg_counts',
+                 'laser', 'odometry_left_raw', 'odometry_right_raw', 'gyro_raw',
+                 'accelerometer_raw', 'magnetometer_raw', 'gps_raw',
+                 'motor_pwm', 'prev_odo', 'time')
+
+    def __init__(self, get, put, annot=None, term=LASER_ID, latency=None, telemetry=None):
+        """
+        provide input and output methods, latency is optional LatencyMonitor,
+        telemetry is optional TelemetryPublisher called after every update
+        """
         self.get = get
         self.put = put
         self.term = term
         self._annot = annot
-        
+        self.latency = latency
+        self.telemetry = telemetry
+        self.update_end = None
+        self.decoders = DECODERS
+        self.msg_counts = [0] * 256  # number of received messages of each type
+
         self.laser = None
         self.odometry_left_raw = 0
         self.odometry_right_raw = 0
         self.gyro_raw = None
+        self.accelerometer_raw = None
+        self.magnetometer_raw = None
+        self.gps_raw = None
 
         self.motor_pwm = [0, 0]
         self.prev_odo = None
         self.time = None
 
     def update(self):
+        if self.latency is not None:
+            return self.update_with_latency()
         while True:
             self.time, msg_type, data = self.get()
-            if msg_type == LASER_ID:
-                self.update_laser(data)
-            elif msg_type == ODOMETRY_ID:
-                self.update_odometry(data)
-            elif msg_type == GYRO_ID:
-                self.update_gyro(data)
+            self.handle(msg_type, data)
+            if msg_type == self.term:
+                break
 
+        self.put((MOTOR_ID, self.get_motor_cmd()))
+        if self.telemetry is not None:
+            self.telemetry.publish(self)
+
+    def update_with_latency(self):
+        "update() with timers of the hot path"
+        latency = self.latency
+        start = perf_counter()
+        if self.update_end is not None:
+            latency.record('decision', self.update_end, start)  # time outside update()
+        decode = 0.0
+        while True:
+            self.time, msg_type, data = self.get()
+            received = perf_counter()
+            self.handle(msg_type, data)
+            decode += perf_counter() - received
             if msg_type == self.term:
                 break
 
+        send_start = perf_counter()
         self.put((MOTOR_ID, self.get_motor_cmd()))
+        end = perf_counter()
+        latency.record('decode', 0.0, decode)
+        latency.record('send', send_start, end)
+        latency.record('reaction', received, end)  # from terminal message to motor command
+        latency.record('update', start, end)
+        latency.tick(end)
+        if self.telemetry is not None:
+            self.telemetry.publish(self)
+        self.update_end = perf_counter()
+
+    def handle(self, msg_type, data):
+        self.msg_counts[msg_type] += 1
+        entry = self.decoders.get(msg_type)
+        if entry is not None:
+            decoder, handler = entry
+            handler(self, data if decoder is None else decoder.unpack(data))
 
     def annot(self, annotation):
         'note, that annotation is expected binary bytes'
@@ -72,25 +129,58 @@ class Robot:
         while self.time - start_time < how_long:
             self.update()
 
-    def update_laser(self, data):
-        assert len(data) == 2*271 + 271, len(data)
-        self.laser = struct.unpack('>' + 'H'*271, data[:2*271])[45:-45]
+    # Message handlers - called with values decoded by registered struct
+    def on_laser(self, values):
+        self.laser = values[45:271-45]  # distances restricted to 180deg
 
-    def update_odometry(self, data):
-        assert len(data) == 4, len(data)
+    def on_odometry(self, values):
         # FR, RR, RL, FL
         if self.prev_odo is not None:
-            diff = [a^b for a, b in zip(self.prev_odo, data)]
+            diff = [a^b for a, b in zip(self.prev_odo, values)]
             self.odometry_right_raw += diff[0] + diff[1]
             self.odometry_left_raw += diff[2] + diff[3]
-        self.prev_odo = data
+        self.prev_odo = values
 
-    def update_gyro(self, data):
-        assert len(data) == 6, len(data)
+    def on_gyro(self, values):
         # X, Y, Z (gain factor 30.5)
-        self.gyro_raw = struct.unpack('>hhh', data)
+        self.gyro_raw = values
+
+    def on_accelerometer(self, values):
+        self.accelerometer_raw = values
+
+    def on_magnetometer(self, values):
+        self.magnetometer_raw = values
+
+    def on_gps(self, data):
+        self.gps_raw = bytes(data)
+
+    def update_laser(self, data):
+        self.on_laser(LASER_STRUCT.unpack(data))
+
+    def update_odometry(self, data):
+        self.on_odometry(ODOMETRY_STRUCT.unpack(data))
+
+    def update_gyro(self, data):
+        self.on_gyro(IMU_STRUCT.unpack(data))
 
     def get_motor_cmd(self):
         return bytes(self.motor_pwm)
 
+
+# msg_id: (decoder, handler) - handler gets values unpacked by decoder
+# or raw data if decoder is None, other message types are only counted
+DECODERS = {
+    ODOMETRY_ID: (ODOMETRY_STRUCT, Robot.on_odometry),
+    LASER_ID: (LASER_STRUCT, Robot.on_laser),
+    GPS_ID: (None, Robot.on_gps),
+    ACCELEROMETER_ID: (IMU_STRUCT, Robot.on_accelerometer),
+    GYRO_ID: (IMU_STRUCT, Robot.on_gyro),
+    MAGNETOMETER_ID: (IMU_STRUCT, Robot.on_magnetometer),
+}
+
+
+def register(msg_id, decoder, handler):
+    "add handler(robot, values) of new message type, decoder is struct.Struct or None"
+    DECODERS[msg_id] = (decoder, handler)
+
 # vim: expandtab sw=4 ts=4
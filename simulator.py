@@ -0,0 +1,176 @@
+"""
+  Fake robot server for load testing - replays recorded input of a log or
+  sends synthetic NAIO frames, accepts motor commands and optionally serves
+  video port
+  usage:
+     python simulator.py [--replay LOG] [--laser-rate HZ] [--speed X] [--video-port 5558]
+"""
+
+import argparse
+import heapq
+import random
+import socket
+import struct
+import time
+import zlib
+from threading import Thread
+
+from logger import LogReader, LogEnd, MICROSECOND
+from naio import NaioDecoder, naio_frame
+from synthlog import laser_scan, periodic, video_image, LASER_ID, ODOMETRY_ID, GYRO_ID, VIDEO_ID
+
+
+DEFAULT_PORT = 5559
+DEFAULT_VIDEO_PORT = 5558
+
+INPUT_STREAM = 1
+VIDEO_STREAM = 3
+
+MOTOR_ID = 0x01
+
+
+def log_source(filename, stream_id):
+    "yield (microseconds, data) of recorded stream, video is decompressed"
+    with LogReader(filename) as log:
+        while True:
+            try:
+                dt, __, data = log.read(stream_id)
+            except LogEnd:
+                break
+            if stream_id == VIDEO_STREAM:
+                if len(data) == 0:
+                    continue  # gap of dropped chunks
+                data = zlib.decompress(data)
+            yield dt // MICROSECOND, data
+
+
+def synthetic_source(laser_rate=10.0, odometry_rate=20.0, gyro_rate=50.0, duration=3600.0, seed=0):
+    "yield (microseconds, frame) of generated sensor data"
+    rand = random.Random(seed)
+    scans = [laser_scan(rand, i / 10.0) for i in range(50)]  # generating is slower than 1kHz
+    odo = [0, 0, 0, 0]
+    num_scans = 0
+    for microseconds, kind in heapq.merge(periodic(laser_rate, duration, LASER_ID),
+                                          periodic(odometry_rate, duration, ODOMETRY_ID),
+                                          periodic(gyro_rate, duration, GYRO_ID)):
+        if kind == LASER_ID:
+            yield microseconds, naio_frame(LASER_ID, scans[num_scans % len(scans)])
+            num_scans += 1
+        elif kind == ODOMETRY_ID:
+            odo = [x ^ (rand.random() < 0.5) for x in odo]
+            yield microseconds, naio_frame(ODOMETRY_ID, bytes(odo))
+        else:
+            yield microseconds, naio_frame(GYRO_ID, struct.pack('>hhh', 0, 0, rand.randint(-200, 200)))
+
+
+def synthetic_video(fps=10.0, duration=3600.0):
+    "yield (microseconds, frame) of generated video, images are numbered from zero"
+    for index, (microseconds, __) in enumerate(periodic(fps, duration, VIDEO_ID)):
+        yield microseconds, naio_frame(VIDEO_ID, video_image(index))
+
+
+class FakeRobot:
+    "send data of source to connected client with given speed (None = unlimited)"
+    def __init__(self, source, speed=1.0):
+        self.source = source
+        self.speed = speed
+        self.bytes_sent = 0
+        self.blocks_sent = 0
+        self.commands = 0
+        self.bad_frames = 0
+        self.motor_pwm = None
+        self.duration = None
+
+    def receive_commands(self, soc):
+        decoder = NaioDecoder()
+        while True:
+            try:
+                data = soc.recv(4096)
+            except OSError:
+                break
+            if len(data) == 0:
+                break
+            decoder.feed(data)
+            for msg_id, payload in decoder.frames():
+                if msg_id == MOTOR_ID:
+                    self.commands += 1
+                    self.motor_pwm = bytes(payload)
+            self.bad_frames = decoder.bad_frames
+
+    def serve(self, soc):
+        receiver = Thread(target=self.receive_commands, args=(soc,), daemon=True)
+        receiver.start()
+        start = time.monotonic()
+        try:
+            for microseconds, data in self.source:
+                if self.speed is not None:
+                    delay = start + microseconds / 1000000.0 / self.speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                soc.sendall(data)
+                self.bytes_sent += len(data)
+                self.blocks_sent += 1
+        except OSError:
+            pass  # client disconnected
+        self.duration = time.monotonic() - start
+        try:
+            soc.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        receiver.join()
+
+    def report(self):
+        duration = max(self.duration, 1e-6)
+        return ('%d blocks, %d bytes in %.2fs (%.0f blocks/s, %.1f MB/s), %d commands (%.1f/s), '
+                'last pwm %s' % (self.blocks_sent, self.bytes_sent, duration, self.blocks_sent / duration,
+                                 self.bytes_sent / duration / 1e6, self.commands,
+                                 self.commands / duration, self.motor_pwm))
+
+
+def serve(port, make_source, speed, name='robot'):
+    "accept single client on port and serve it"
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('', port))
+    server.listen(1)
+    print(name, 'waiting on port', port)
+    soc, addr = server.accept()
+    print(name, 'connected', addr)
+    with soc:
+        robot = FakeRobot(make_source(), speed=speed)
+        robot.serve(soc)
+    server.close()
+    print(name, robot.report())
+    return robot
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake Naio robot for load testing')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='robot port')
+    parser.add_argument('--video-port', dest='video_port', type=int,
+                        help='serve also video, i.e. %d' % DEFAULT_VIDEO_PORT)
+    parser.add_argument('--replay', help='send recorded input of this log file')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='pacing factor, 0 = as fast as possible')
+    parser.add_argument('--laser-rate', dest='laser_rate', type=float, default=10.0, help='Hz')
+    parser.add_argument('--odometry-rate', dest='odometry_rate', type=float, default=20.0, help='Hz')
+    parser.add_argument('--gyro-rate', dest='gyro_rate', type=float, default=50.0, help='Hz')
+    parser.add_argument('--video-fps', dest='video_fps', type=float, default=10.0,
+                        help='synthetic video frame rate')
+    parser.add_argument('--duration', type=float, default=3600.0, help='synthetic data duration')
+    args = parser.parse_args()
+
+    speed = args.speed if args.speed > 0 else None
+    if args.replay is not None:
+        make_source = lambda: log_source(args.replay, INPUT_STREAM)
+        make_video = lambda: log_source(args.replay, VIDEO_STREAM)
+    else:
+        make_source = lambda: synthetic_source(args.laser_rate, args.odometry_rate,
+                                               args.gyro_rate, args.duration)
+        make_video = lambda: synthetic_video(args.video_fps, args.duration)
+
+    if args.video_port is not None:
+        Thread(target=serve, args=(args.video_port, make_video, speed, 'video'), daemon=True).start()
+    serve(args.port, make_source, speed)
+
+# vim: expandtab sw=4 ts=4
@@ -0,0 +1,130 @@
+"""
+  Parallel sweep of navigation constants over recorded runs - every
+  combination is replayed against every log and generated motor commands
+  are compared with the recorded ones
+  usage:
+     python sweep.py <logs or dirs> --param MAX_GAP_SIZE=11,13,15 --param NEAR_LIMIT=0.9,1.0
+                     [--test loops] [--jobs N] [--output results.csv]
+"""
+
+import argparse
+import itertools
+import sys
+from multiprocessing import Pool
+
+import myr2017
+from logbatch import find_logs, write_table
+from replay import replay
+
+
+# module globals of myr2017 which can be swept
+SWEEP_PARAMETERS = ['MAX_GAP_SIZE', 'OPEN_SIZE', 'OFFSET_SIZE', 'END_OF_ROW_SIZE',
+                    'NEAR_LIMIT', 'FAR_LIMIT']
+DEFAULTS = dict([(name, getattr(myr2017, name)) for name in SWEEP_PARAMETERS])
+
+
+def parameter_grid(values):
+    "return list of dicts of all combinations, values is dict name: list of values"
+    for name in values:
+        assert name in SWEEP_PARAMETERS, name
+    names = sorted(values.keys())
+    return [dict(zip(names, combination))
+            for combination in itertools.product(*[values[name] for name in names])]
+
+
+def set_parameters(params):
+    "configure navigation of this process, parameters not given are set to defaults"
+    for name in SWEEP_PARAMETERS:
+        setattr(myr2017, name, params.get(name, DEFAULTS[name]))
+
+
+def replay_with(task):
+    "return result row of single (index, params, filename, test_case) task"
+    index, params, filename, test_case = task
+    row = {'combination': index, 'filename': filename}
+    row.update(params)
+    set_parameters(params)
+    try:
+        stats = replay(filename, test_case=test_case, force=True)
+    except Exception as e:
+        row['error'] = repr(e)
+        return row
+    for key in ['cycles', 'outputs', 'matching', 'match_ratio', 'first_divergence', 'duration']:
+        row[key] = stats[key]
+    return row
+
+
+def summarize(rows, combinations):
+    "return one row per combination with match statistics over all logs"
+    ret = []
+    for index, params in enumerate(combinations):
+        results = [row for row in rows if row['combination'] == index
+                   and row.get('match_ratio') is not None]
+        row = {'combination': index}
+        row.update(params)
+        row['logs'] = len(results)  # logs with motor commands
+        row['errors'] = len([r for r in rows if r['combination'] == index and 'error' in r])
+        if len(results) > 0:
+            row['min_match_ratio'] = min([r['match_ratio'] for r in results])
+            row['mean_match_ratio'] = sum([r['match_ratio'] for r in results]) / len(results)
+            divergences = [r['first_divergence'] for r in results if r['first_divergence'] is not None]
+            row['diverged'] = len(divergences)
+            row['min_first_divergence'] = min(divergences) if len(divergences) > 0 else None
+        ret.append(row)
+    return ret
+
+
+def sweep(filenames, values, test_case=None, jobs=None, progress=None):
+    "replay all logs with all combinations in process pool, return (rows, summary)"
+    combinations = parameter_grid(values)
+    tasks = [(index, params, filename, test_case)
+             for index, params in enumerate(combinations) for filename in filenames]
+    rows = []
+    with Pool(processes=jobs) as pool:
+        for row in pool.imap_unordered(replay_with, tasks, chunksize=1):
+            rows.append(row)
+            if progress is not None:
+                progress(len(rows), len(tasks))
+    rows.sort(key=lambda row: (row['combination'], row['filename']))
+    return rows, summarize(rows, combinations)
+
+
+def parse_param(text):
+    "NAME=1,2,3 -> (name, [values])"
+    name, __, values = text.partition('=')
+    ret = []
+    for value in values.split(','):
+        try:
+            ret.append(int(value))
+        except ValueError:
+            ret.append(float(value))
+    return name, ret
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sweep navigation constants over recorded runs')
+    parser.add_argument('paths', nargs='+', help='log files or directories with naio*.log')
+    parser.add_argument('--param', dest='params', action='append', default=[], type=parse_param,
+                        help='NAME=v1,v2,... one of ' + ', '.join(SWEEP_PARAMETERS))
+    parser.add_argument('--test', dest='test_case', help='test case of the recorded runs',
+                        choices=['1m', '90deg', 'loops', 'enter'])
+    parser.add_argument('--jobs', '-j', type=int, help='number of processes (default all cores)')
+    parser.add_argument('--format', dest='output_format', choices=['csv', 'json'], default='csv')
+    parser.add_argument('--output', '-o', help='per log results (default only summary)')
+    args = parser.parse_args()
+
+    values = dict(args.params)
+    for name in values:
+        if name not in SWEEP_PARAMETERS:
+            parser.error('unknown parameter %s' % name)
+    progress = lambda done, total: print('%d/%d' % (done, total), end='\r', file=sys.stderr)
+    rows, summary = sweep(find_logs(args.paths), values, test_case=args.test_case,
+                          jobs=args.jobs, progress=progress)
+    print(file=sys.stderr)
+    if args.output is not None:
+        with open(args.output, 'w', newline='') as f:
+            write_table(rows, f, args.output_format)
+    summary.sort(key=lambda row: -row.get('mean_match_ratio', -1))
+    write_table(summary, sys.stdout, args.output_format)
+
+# vim: expandtab sw=4 ts=4
@@ -0,0 +1,128 @@
+"""
+  Generator of synthetic logs with realistic NAIO traffic
+  usage:
+     python synthlog.py [--duration SEC] [--laser-rate HZ] [--video-fps FPS]
+"""
+
+import argparse
+import heapq
+import math
+import random
+import struct
+import zlib
+from datetime import timedelta
+
+from logger import LogWriter
+from naio import naio_frame
+
+
+ANNOT_STREAM = 0
+INPUT_STREAM = 1
+OUTPUT_STREAM = 2
+VIDEO_STREAM = 3
+
+MOTOR_ID = 0x01
+ODOMETRY_ID = 0x06
+LASER_ID = 0x07
+GYRO_ID = 0x0A
+VIDEO_ID = 0x20  # not used by Robot, any id is fine
+
+IMAGE_SIZE = 752*480*2
+VIDEO_CHUNK_SIZE = 0x80000
+
+LASER_STRUCT = struct.Struct('>271H')
+GYRO_STRUCT = struct.Struct('>hhh')
+
+
+def laser_scan(rand, t):
+    "plants in rows 35cm left and right, some readings are lost"
+    scan = []
+    for i in range(271):
+        angle = math.radians(i - 135)
+        side = abs(math.sin(angle))
+        dist = 350 / side if side > 0.01 else 10000
+        dist += rand.randint(-30, 30) + 200 * math.sin(t + i / 10.0)
+        if dist > 4000 or rand.random() < 0.05:
+            dist = 0
+        scan.append(max(0, int(dist)))
+    return LASER_STRUCT.pack(*scan) + bytes([rand.randint(0, 255) for i in range(271)])
+
+
+def periodic(rate, duration, kind):
+    "yield (microseconds, kind) for events with given rate in Hz"
+    if rate is None or rate <= 0:
+        return
+    step = 1000000.0 / rate
+    for i in range(int(duration * rate)):
+        yield int(i * step), kind
+
+
+def video_image(index):
+    header = bytes([0, 0, 0, 0, index & 0xFF])
+    row = bytes([(index + x) & 0xFF for x in range(752*2)])
+    return header + row * 480
+
+
+def generate(prefix='synth', duration=60.0, laser_rate=10.0, odometry_rate=20.0,
+             gyro_rate=50.0, video_fps=None, version=1, seed=0):
+    "write synthetic log and return its filename"
+    rand = random.Random(seed)
+    events = heapq.merge(periodic(laser_rate, duration, LASER_ID),
+                         periodic(odometry_rate, duration, ODOMETRY_ID),
+                         periodic(gyro_rate, duration, GYRO_ID),
+                         periodic(video_fps, duration, VIDEO_ID))
+    odo = [0, 0, 0, 0]
+    num_images = 0
+    input_buf = bytearray()
+    video_buf = bytearray()
+    with LogWriter(prefix=prefix, version=version) as log:
+        log.write_record(timedelta(), ANNOT_STREAM, b'synthetic log')
+        for microseconds, kind in events:
+            dt = timedelta(microseconds=microseconds)
+            if kind == VIDEO_ID:
+                video_buf += naio_frame(VIDEO_ID, video_image(num_images))
+                num_images += 1
+                while len(video_buf) >= VIDEO_CHUNK_SIZE:
+                    log.write_record(dt, VIDEO_STREAM, zlib.compress(video_buf[:VIDEO_CHUNK_SIZE], 1))
+                    del video_buf[:VIDEO_CHUNK_SIZE]
+                continue
+            if kind == LASER_ID:
+                input_buf += naio_frame(LASER_ID, laser_scan(rand, microseconds / 1000000.0))
+            elif kind == ODOMETRY_ID:
+                odo = [x ^ (rand.random() < 0.5) for x in odo]
+                input_buf += naio_frame(ODOMETRY_ID, bytes(odo))
+            elif kind == GYRO_ID:
+                input_buf += naio_frame(GYRO_ID, GYRO_STRUCT.pack(
+                        rand.randint(-20, 20), rand.randint(-20, 20), rand.randint(-200, 200)))
+            # received in blocks of 1024 bytes, i.e. WrapperIO on a slow link
+            while len(input_buf) >= 1024:
+                log.write_record(dt, INPUT_STREAM, input_buf[:1024])
+                del input_buf[:1024]
+            if kind == LASER_ID:
+                cmd = bytes([0x70, 0x70])
+                log.write_record(dt, OUTPUT_STREAM, naio_frame(MOTOR_ID, cmd, crc=0xCDCDCDCD))
+        end = timedelta(seconds=duration)
+        if len(input_buf) > 0:
+            log.write_record(end, INPUT_STREAM, input_buf)
+        if len(video_buf) > 0:
+            log.write_record(end, VIDEO_STREAM, zlib.compress(video_buf, 1))
+    return log.filename
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate synthetic log file')
+    parser.add_argument('--prefix', default='synth', help='log filename prefix')
+    parser.add_argument('--duration', type=float, default=60.0, help='duration in seconds')
+    parser.add_argument('--laser-rate', dest='laser_rate', type=float, default=10.0, help='Hz')
+    parser.add_argument('--odometry-rate', dest='odometry_rate', type=float, default=20.0, help='Hz')
+    parser.add_argument('--gyro-rate', dest='gyro_rate', type=float, default=50.0, help='Hz')
+    parser.add_argument('--video-fps', dest='video_fps', type=float, help='add video stream')
+    parser.add_argument('--version', type=int, default=1, choices=[0, 1], help='log format version')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+
+    print(generate(prefix=args.prefix, duration=args.duration, laser_rate=args.laser_rate,
+                   odometry_rate=args.odometry_rate, gyro_rate=args.gyro_rate,
+                   video_fps=args.video_fps, version=args.version, seed=args.seed))
+
+# vim: expandtab sw=4 ts=4
@@ -0,0 +1,157 @@
+"""
+  Latest robot state published in shared memory for local viewers
+  usage:
+     python telemetry.py <shared memory name> [--period SEC]
+"""
+
+import argparse
+import struct
+import time
+from datetime import timedelta
+from multiprocessing import shared_memory
+
+from logger import MICROSECOND
+
+
+LASER_SIZE = 181  # distances restricted to 180deg
+
+# seqlock sequence number, odd while the writer is updating the snapshot
+SEQUENCE = struct.Struct('<Q')
+# updates, time [us] or -1, odometry left/right, gyro X/Y/Z, motor pwm, flags, laser [mm]
+SNAPSHOT = struct.Struct('<QqiihhhBBB%dH' % LASER_SIZE)
+SHM_SIZE = SEQUENCE.size + SNAPSHOT.size
+
+FLAG_LASER = 0x01
+FLAG_GYRO = 0x02
+
+DEFAULT_NAME = 'myr2017'
+
+published_names = set()  # segments created by publishers of this process
+
+
+class TelemetryPublisher:
+    "single writer of robot snapshots, viewers attach by name"
+    def __init__(self, name=DEFAULT_NAME):
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=SHM_SIZE)
+        self.name = self.shm.name
+        published_names.add(self.shm._name)
+        self.buf = self.shm.buf
+        self.sequence = 0
+        self.updates = 0
+        self.empty_laser = (0,) * LASER_SIZE
+        SEQUENCE.pack_into(self.buf, 0, self.sequence)
+
+    def publish(self, robot):
+        self.updates += 1
+        flags = 0
+        laser = robot.laser
+        if laser is None:
+            laser = self.empty_laser
+        else:
+            flags |= FLAG_LASER
+        gyro = robot.gyro_raw
+        if gyro is None:
+            gyro = (0, 0, 0)
+        else:
+            flags |= FLAG_GYRO
+        microseconds = -1 if robot.time is None else robot.time // MICROSECOND
+        left, right = robot.motor_pwm
+
+        buf = self.buf
+        self.sequence += 1
+        SEQUENCE.pack_into(buf, 0, self.sequence)  # odd = being written
+        SNAPSHOT.pack_into(buf, SEQUENCE.size, self.updates, microseconds,
+                           robot.odometry_left_raw, robot.odometry_right_raw,
+                           gyro[0], gyro[1], gyro[2], left, right, flags, *laser)
+        self.sequence += 1
+        SEQUENCE.pack_into(buf, 0, self.sequence)
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        self.shm.unlink()
+        published_names.discard(self.shm._name)
+
+    # context manager functions
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class TelemetryReader:
+    "any number of readers can attach to the publisher, the writer never waits for them"
+    def __init__(self, name=DEFAULT_NAME):
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13 - the segment would be removed with the first reader,
+            # the tracker of this process is shared with the publisher
+            from multiprocessing import resource_tracker
+            self.shm = shared_memory.SharedMemory(name=name)
+            if self.shm._name not in published_names:
+                resource_tracker.unregister(self.shm._name, 'shared_memory')
+        self.buf = self.shm.buf
+
+    def read(self, retries=1000):
+        "return consistent snapshot as dict or None if nothing was published yet"
+        buf = self.buf
+        for i in range(retries):
+            sequence = SEQUENCE.unpack_from(buf, 0)[0]
+            if sequence & 1:
+                continue  # writer is in the middle of update
+            values = SNAPSHOT.unpack_from(buf, SEQUENCE.size)
+            if SEQUENCE.unpack_from(buf, 0)[0] == sequence:
+                break
+        else:
+            raise TimeoutError('no consistent snapshot after %d retries' % retries)
+        updates, microseconds, left, right, gx, gy, gz, pwm_left, pwm_right, flags = values[:10]
+        if updates == 0:
+            return None
+        return {
+            'sequence': sequence,
+            'updates': updates,
+            'time': None if microseconds < 0 else timedelta(microseconds=microseconds),
+            'odometry_left_raw': left,
+            'odometry_right_raw': right,
+            'gyro_raw': (gx, gy, gz) if flags & FLAG_GYRO else None,
+            'motor_pwm': [pwm_left, pwm_right],
+            'laser': values[10:] if flags & FLAG_LASER else None,
+        }
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+
+    # context manager functions
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Show telemetry of running robot')
+    parser.add_argument('name', nargs='?', default=DEFAULT_NAME, help='shared memory name')
+    parser.add_argument('--period', type=float, default=0.1, help='refresh period in seconds')
+    args = parser.parse_args()
+
+    with TelemetryReader(args.name) as reader:
+        sequence = None
+        try:
+            while True:
+                snapshot = reader.read()
+                if snapshot is not None and snapshot['sequence'] != sequence:
+                    sequence = snapshot['sequence']
+                    laser = snapshot['laser']
+                    nearest = min([x for x in laser if x > 0], default=0) if laser else None
+                    print(snapshot['time'], 'odo', snapshot['odometry_left_raw'],
+                          snapshot['odometry_right_raw'], 'gyro', snapshot['gyro_raw'],
+                          'pwm', snapshot['motor_pwm'], 'nearest', nearest)
+                time.sleep(args.period)
+        except KeyboardInterrupt:
+            pass
+
+# vim: expandtab sw=4 ts=4
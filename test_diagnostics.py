@@ -0,0 +1,43 @@
+import unittest
+from threading import Event
+
+from diagnostics import *
+
+
+class DiagnosticsTest(unittest.TestCase):
+
+    def test_merge_and_drop(self):
+        lines = []
+        writing = Event()
+        release = Event()
+        def slow_write(text):
+            writing.set()
+            release.wait()
+            lines.append(text)
+
+        diag = Diagnostics(write=slow_write, rate=None, max_pending=2)
+        diag('first %d', 0)
+        writing.wait()  # the writer is blocked by the first message
+        for i in range(100):
+            diag('max_dist %d', i)
+        diag('enter_field')
+        diag('dropped')
+        # caller did not wait for the output
+        self.assertEqual(lines, [])
+        self.assertEqual(diag.stats, {'written': 0, 'merged': 99, 'dropped': 1, 'errors': 0,
+                                      'pending': 2})
+        release.set()
+        diag.close()
+
+        self.assertEqual(lines, ['first 0', 'max_dist 99 (+99 merged)', 'enter_field'])
+        self.assertEqual(diag.stats, {'written': 3, 'merged': 99, 'dropped': 1, 'errors': 0,
+                                      'pending': 0})
+
+    def test_write_error(self):
+        def broken_write(text):
+            raise BrokenPipeError()
+        with Diagnostics(write=broken_write) as diag:
+            diag('%s %s', 'lost', (1, 2))
+        self.assertEqual(diag.stats['errors'], 1)
+
+# vim: expandtab sw=4 ts=4
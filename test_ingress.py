@@ -0,0 +1,70 @@
+import unittest
+import os
+import socket
+import time
+from threading import Thread
+
+from logger import LogWriter, LogReader
+from naio import naio_frame
+from robot import Robot, ODOMETRY_ID, LASER_ID
+from myr2017 import WrapperIO, INPUT_STREAM
+from ingress import *
+
+
+class IngressTest(unittest.TestCase):
+
+    def test_drain(self):
+        a, b = socket.socketpair()
+        with a, b:
+            ingress = SocketIngress(a, capacity=1000)
+            for i in range(5):
+                b.sendall(bytes([i]) * 100)
+            self.assertEqual(bytes(ingress.read()), b''.join([bytes([i]) * 100 for i in range(5)]))
+            b.sendall(bytes(1500))
+            self.assertEqual(len(ingress.read()), 1000)  # capacity
+            self.assertEqual(len(ingress.read()), 500)
+            b.close()
+            self.assertEqual(len(ingress.read()), 0)
+        self.assertEqual(ingress.stats['reads'], 4)
+        self.assertEqual(ingress.stats['max_batch'], 1000)
+
+    def test_replay(self):
+        a, b = socket.socketpair()
+        scan = bytes(3 * 271)
+
+        def fake_robot():
+            for i in range(20):
+                b.sendall(b''.join([naio_frame(ODOMETRY_ID, bytes([j & 1, 0, 0, 0]))
+                                    for j in range(i)]) + naio_frame(LASER_ID, scan))
+                time.sleep(0.001)
+            b.sendall(naio_frame(LASER_ID, scan) * 50)
+            b.shutdown(socket.SHUT_WR)  # motor commands are not read
+
+        robot_thread = Thread(target=fake_robot)
+        robot_thread.start()
+        with a, b, LogWriter(prefix='tmpg', version=1) as log:
+            filename = log.filename
+            io = WrapperIO(a, log)
+            robot = Robot(io.get, io.put, io.annot, term=LASER_ID)
+            live = []
+            try:
+                while True:
+                    robot.update()
+                    live.append((robot.time, robot.odometry_right_raw))
+            except ConnectionError:
+                pass
+            robot_thread.join()
+        self.assertGreater(len(live), 60)
+
+        with LogReader(filename) as log:
+            self.assertLess(log.count(INPUT_STREAM), 30)
+            io = WrapperIO(None, log)
+            robot = Robot(io.get, io.put, io.annot, term=LASER_ID)
+            replay = []
+            for i in range(len(live)):
+                robot.update()
+                replay.append((robot.time, robot.odometry_right_raw))
+        self.assertEqual(live, replay)
+        os.remove(filename)
+
+# vim: expandtab sw=4 ts=4
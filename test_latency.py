@@ -0,0 +1,42 @@
+import unittest
+import json
+from queue import Queue
+from datetime import timedelta
+
+from latency import *
+from robot import Robot, ODOMETRY_ID
+
+
+class LatencyTest(unittest.TestCase):
+
+    def test_histogram(self):
+        hist = Histogram()
+        for value in range(1, 10001):
+            hist.record(value)
+        self.assertEqual(hist.count, 10000)
+        self.assertEqual((hist.min, hist.max), (1, 10000))
+        for p in [50, 90, 99]:
+            self.assertAlmostEqual(hist.percentile(p), p * 100, delta=p * 100 * 0.07)
+        for value in range(100000):
+            self.assertLessEqual(Histogram.bucket_value(Histogram.bucket(value)), value)
+
+        copy = Histogram.from_dict(json.loads(json.dumps(hist.to_dict())))
+        self.assertEqual(copy.percentile(90), hist.percentile(90))
+
+    def test_robot_latency(self):
+        q_in = Queue()
+        q_out = Queue()
+        records = []
+        latency = LatencyMonitor(write=records.append, period=0.0)
+        robot = Robot(q_in.get, q_out.put, term=ODOMETRY_ID, latency=latency)
+        for i in range(3):
+            q_in.put((timedelta(seconds=i), ODOMETRY_ID, b'\x00\x00\x00\x00'))
+            robot.update()
+        self.assertEqual(q_out.qsize(), 3)
+        self.assertEqual(len(records), 3)
+        self.assertEqual(sorted(json.loads(records[-1].decode('utf-8'))),
+                         ['decision', 'decode', 'reaction', 'send', 'update'])
+        self.assertEqual(latency.totals['update'].count, 3)
+        self.assertIn('reaction', latency.summary())
+
+# vim: expandtab sw=4 ts=4
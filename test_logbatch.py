@@ -0,0 +1,61 @@
+import unittest
+import os
+import struct
+from datetime import timedelta
+
+from logger import LogWriter
+from naio import naio_frame
+from synthlog import generate
+from logbatch import *
+
+
+def input_frames(odometry, gyro):
+    return (b''.join([naio_frame(ODOMETRY_ID, bytes(odo)) for odo in odometry])
+            + b''.join([naio_frame(GYRO_ID, struct.pack('>hhh', *xyz)) for xyz in gyro]))
+
+
+class LogBatchTest(unittest.TestCase):
+
+    def test_summarize(self):
+        with LogWriter(prefix='tmpb', version=1) as log:
+            filename = log.filename
+            log.write_record(timedelta(seconds=1), ANNOT_STREAM, b'TAG:turn:BEGIN')
+            log.write_record(timedelta(seconds=2), INPUT_STREAM, input_frames(
+                    [[1, 0, 0, 0], [1, 1, 0, 0]], [(10, -20, 300)]))
+            log.write_record(timedelta(seconds=3), ANNOT_STREAM, b'TAG:turn:END')
+            log.write_record(timedelta(seconds=4), ANNOT_STREAM, b'TAG:enter:BEGIN')
+            log.write_record(timedelta(seconds=5), INPUT_STREAM, input_frames(
+                    [[0, 1, 1, 1]], [(-5, 40, -300), (0, 0, 0)]))
+            log.write_record(timedelta(seconds=6.5), ANNOT_STREAM, b'TAG:turn:BEGIN')
+            log.write_record(timedelta(seconds=7), ANNOT_STREAM, b'TAG:turn:END')
+            log.write_record(timedelta(seconds=8), ANNOT_STREAM, b'TAG:enter:END')
+            log.write_record(timedelta(seconds=9), ANNOT_STREAM, b'TAG:unfinished:BEGIN')
+
+        summary = summarize(filename)
+        self.assertEqual(summary['duration'], 9.0)
+        self.assertEqual(summary['records'], 9)
+        self.assertEqual(summary['msg_06'], 3)
+        self.assertEqual(summary['msg_0A'], 3)
+        self.assertAlmostEqual(summary['distance'], 5 * ODOMETRY_STEP)  # changed bits
+        self.assertAlmostEqual(summary['tag_turn'], 2.5)  # both occurrences
+        self.assertAlmostEqual(summary['tag_enter'], 4.0)
+        self.assertNotIn('tag_unfinished', summary)
+        self.assertAlmostEqual(summary['gyro_x_min'], -5 * GYRO_GAIN)
+        self.assertAlmostEqual(summary['gyro_y_max'], 40 * GYRO_GAIN)
+        self.assertAlmostEqual(summary['gyro_z_min'], -300 * GYRO_GAIN)
+        self.assertAlmostEqual(summary['gyro_z_max'], 300 * GYRO_GAIN)
+        os.remove(filename)
+
+    def test_synthetic_log(self):
+        filename = generate(prefix='tmpb', duration=2.0)
+        summary = safe_summarize(filename)
+        self.assertNotIn('error', summary)
+        self.assertEqual(summary['duration'], 2.0)
+        self.assertEqual((summary['msg_07'], summary['msg_06'], summary['msg_0A']), (20, 40, 100))
+        self.assertEqual(summary['bad_frames'], 0)
+        self.assertGreater(summary['distance'], 0)
+        self.assertLessEqual(summary['gyro_z_max'], 200 * GYRO_GAIN)
+        self.assertGreaterEqual(summary['gyro_z_min'], -200 * GYRO_GAIN)
+        os.remove(filename)
+
+# vim: expandtab sw=4 ts=4
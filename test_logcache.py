@@ -0,0 +1,43 @@
+import unittest
+import os
+import shutil
+import struct
+
+from logger import LogWriter
+from naio import naio_frame
+from logcache import *
+
+
+class LogCacheTest(unittest.TestCase):
+
+    def test_export(self):
+        scan = struct.pack('>271H', *range(271)) + bytes(range(256)) + bytes(15)
+        with LogWriter(prefix='tmpc') as log:
+            filename = log.filename
+            data = (naio_frame(ODOMETRY_ID, b'\x00\x00\x00\x00')
+                    + naio_frame(LASER_ID, scan)
+                    + naio_frame(ODOMETRY_ID, b'\x01\x01\x00\x01')
+                    + naio_frame(GYRO_ID, struct.pack('>hhh', -1, 2, -300)))
+            log.write(INPUT_STREAM, data[:100])
+            log.write(INPUT_STREAM, data[100:])
+            log.write(OUTPUT_STREAM, naio_frame(MOTOR_ID, b'\x70\x90'))
+
+        arr = load(filename)
+        self.assertEqual(arr['laser_dist'].shape, (1, 271))
+        self.assertEqual(arr['laser_dist'][0, 270], 270)
+        self.assertEqual(arr['laser_intensity'][0, 10], 10)
+        self.assertEqual(arr['odometry_ticks'].tolist(), [[0, 0], [1, 2]])
+        self.assertEqual(arr['gyro_raw'].tolist(), [[-1, 2, -300]])
+        self.assertEqual(arr['motor_pwm'].tolist(), [[0x70, -0x70]])
+        self.assertEqual(len(arr['motor_time']), 1)
+        self.assertIsNotNone(read_meta(filename))
+
+        with open(filename, 'ab') as f:
+            f.write(b'\x00')  # log changed
+        self.assertIsNone(read_meta(filename))
+
+        del arr
+        shutil.rmtree(cache_dir(filename))
+        os.remove(filename)
+
+# vim: expandtab sw=4 ts=4
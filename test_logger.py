@@ -1,10 +1,27 @@
 import unittest
 import os
 import time
+from datetime import timedelta
+from threading import Thread
 
 from logger import *
 
 
+class FullDisk:
+    "file which fails on write, closing closes the real one"
+    def __init__(self, f):
+        self.f = f
+
+    def tell(self):
+        return self.f.tell()
+
+    def write(self, data):
+        raise OSError('no space left')
+
+    def close(self):
+        self.f.close()
+
+
 class LoggerTest(unittest.TestCase):
     
     def test_writer_prefix(self):
@@ -46,4 +63,301 @@ class LoggerTest(unittest.TestCase):
 
         os.remove(log.filename)
 
+    def test_index(self):
+        with LogWriter(prefix='tmpi', note='index test') as log:
+            filename = log.filename
+            log.write(1, b'\x01' * 100)
+            time.sleep(0.01)
+            t2 = log.write(2, b'\x02\x02')
+            log.write(1, b'\x03' * 100)
+            log.write(2, b'\x04\x04')
+
+        with LogReader(filename) as log:
+            self.assertEqual(log.count(), 5)
+            self.assertEqual(log.count(1), 2)
+            self.assertEqual(log.count(7), 0)
+            self.assertEqual([data for __, __, data in log.iter_stream(2)],
+                             [b'\x02\x02', b'\x04\x04'])
+
+            log.seek(t2)
+            t, stream_id, data = log.read()
+            self.assertEqual((t, stream_id, data), (t2, 2, b'\x02\x02'))
+            self.assertEqual(log.read(only_stream_id=2)[2], b'\x04\x04')
+
+            log.seek(t2 + timedelta(hours=1))
+            with self.assertRaises(LogEnd):
+                log.read()
+
+        os.remove(filename)
+
+    def test_mmap_reader(self):
+        with LogWriter(prefix='tmpm') as log:
+            filename = log.filename
+            t1 = log.write(1, b'\x01\x02\x03')
+            t2 = log.write(2, b'\x04')
+            log.write(1, b'\x05\x06')
+
+        with MmapLogReader(filename) as log:
+            t, stream_id, data = log.read()
+            self.assertIsInstance(data, memoryview)
+            self.assertEqual((t, stream_id, bytes(data)), (t1, 1, b'\x01\x02\x03'))
+            self.assertEqual([bytes(data) for __, __, data in log.records(only_stream_id=1)],
+                             [b'\x05\x06'])
+            with self.assertRaises(LogEnd):
+                log.read()
+
+            self.assertEqual([(stream_id, size) for __, stream_id, __, size in log.headers()],
+                             [(1, 3), (2, 1), (1, 2)])
+            self.assertEqual(log.count(1), 2)
+            log.seek(t2)
+            kept = log.read()[2]
+            self.assertEqual(bytes(kept), b'\x04')
+
+        self.assertEqual(bytes(kept), b'\x04')  # slices may outlive the reader
+        os.remove(filename)
+
+    def test_version1(self):
+        big = bytes(range(256)) * 1000
+        with LogWriter(prefix='tmpv', note='ver1', version=1) as log:
+            filename = log.filename
+            t1 = log.write(3, big)
+            # records older than one hour are not supported by ver0
+            log.f.write(log.pack_header(timedelta(hours=30), 3, 4) + b'late')
+
+        for reader_class in [LogReader, MmapLogReader]:
+            with reader_class(filename) as log:
+                self.assertEqual(log.version, 1)
+                self.assertEqual(bytes(log.read()[2]), b'ver1')
+                t, stream_id, data = log.read()
+                self.assertEqual((t, stream_id, bytes(data)), (t1, 3, big))
+                t, stream_id, data = log.read()
+                self.assertEqual((t, stream_id, bytes(data)), (timedelta(hours=30), 3, b'late'))
+                self.assertEqual(log.count(3), 2)
+        os.remove(filename)
+
+    def test_write_record(self):
+        for writer_class in [LogWriter, BufferedLogWriter, LaneLogWriter]:
+            with writer_class(prefix='tmpr', version=1) as log:
+                filename = log.filename
+                log.write_record(timedelta(seconds=1), 1, b'first')
+                log.write_record(timedelta(hours=2), 2, bytearray(b'second'))
+            with LogReader(filename) as log:
+                self.assertEqual(log.read(), (timedelta(seconds=1), 1, b'first'))
+                self.assertEqual(log.read(), (timedelta(hours=2), 2, b'second'))
+            os.remove(filename)
+
+    def test_buffered_writer(self):
+        with BufferedLogWriter(prefix='tmpb', note='buffered', flush_period=None,
+                               fsync=True) as log:
+            filename = log.filename
+            times = [log.write(5, bytes([i]) * i) for i in range(100)]
+        self.assertEqual(log.stats['dropped'], 0)
+        self.assertEqual(log.stats['queue_depth'], 0)
+
+        with LogReader(filename) as log:
+            self.assertEqual(log.read()[2], b'buffered')
+            for i in range(100):
+                self.assertEqual(log.read(), (times[i], 5, bytes([i]) * i))
+            with self.assertRaises(LogEnd):
+                log.read()
+        os.remove(filename)
+
+    def test_buffered_writer_blocking(self):
+        with BufferedLogWriter(prefix='tmpb', version=1, max_queue=2, flush_size=1) as log:
+            filename = log.filename
+            threads = [Thread(target=lambda stream_id=stream_id:
+                              [log.write(stream_id, bytes(1000)) for i in range(200)])
+                       for stream_id in (1, 2, 3)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        self.assertGreater(log.stats['blocked'], 0)
+        self.assertEqual(log.stats['dropped'], 0)
+
+        with LogReader(filename) as log:
+            times = [t for t, __, __ in log.records()]
+        self.assertEqual(len(times), 600)
+        self.assertEqual(times, sorted(times))
+        os.remove(filename)
+
+    def test_buffered_writer_failure(self):
+        log = BufferedLogWriter(prefix='tmpb', max_queue=2, flush_size=1)
+        filename = log.filename
+        f = log.f
+        log.f = FullDisk(f)
+        with self.assertRaises(OSError):
+            for i in range(100):
+                log.write(1, b'lost')  # raised once the queue is full
+        self.assertFalse(log.thread.is_alive())
+        with self.assertRaises(OSError):
+            log.close()
+        self.assertTrue(f.closed)
+        os.remove(filename)
+
+    def test_lane_writer(self):
+        with LaneLogWriter(prefix='tmpl', note='lanes', version=1, flush_period=0.001) as log:
+            filename = log.filename
+            # two threads share stream 0, i.e. diagnostics and annotations
+            threads = [Thread(target=lambda stream_id=stream_id:
+                              [log.write(stream_id, bytes(stream_id * 1000)) for i in range(500)])
+                       for stream_id in (0, 0, 1, 3)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        stats = log.stats
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertEqual(stats['write_wait_1']['count'], 500)
+        self.assertEqual(stats['write_wait_0']['count'], 1001)
+        self.assertGreater(stats['write_wait_3']['max_us'], 0)
+
+        with LogReader(filename) as log:
+            self.assertEqual(log.count(), 2001)
+            self.assertEqual(log.count(3), 500)
+            self.assertEqual(log.read()[2], b'lanes')
+            times = [t for t, __, __ in [log.read() for i in range(2000)]]
+            self.assertEqual(times, sorted(times))
+        os.remove(filename)
+
+    def test_lane_writer_preempted(self):
+        class SlowLaneLogWriter(LaneLogWriter):
+            def pack_header(self, dt, stream_id, size):
+                if size == 4:
+                    time.sleep(0.1)  # writer preempted after taking the time
+                return super().pack_header(dt, stream_id, size)
+
+        with SlowLaneLogWriter(prefix='tmpl', version=1, flush_period=0.001) as log:
+            filename = log.filename
+            slow = Thread(target=log.write, args=(0, b'slow'))
+            slow.start()
+            for i in range(20):
+                time.sleep(0.01)
+                log.write(i % 2, b'fast!')
+            slow.join()
+
+        with LogReader(filename) as log:
+            times = [t for t, __, __ in log.records()]
+            self.assertEqual(len(times), 21)
+            self.assertEqual(times, sorted(times))
+        os.remove(filename)
+
+    def test_lane_writer_failure(self):
+        log = LaneLogWriter(prefix='tmpl', flush_period=0.001)
+        filename = log.filename
+        f = log.f
+        log.f = FullDisk(f)
+        log.write(1, b'lost')
+        log.thread.join(timeout=10.0)  # the merge fails
+        self.assertFalse(log.thread.is_alive())
+        with self.assertRaises(OSError):
+            log.write(1, b'next')
+        with self.assertRaises(OSError):
+            log.close()
+        self.assertTrue(f.closed)
+        os.remove(filename)
+
+    def test_write_wait(self):
+        with LogWriter(prefix='tmpw', version=1) as log:
+            filename = log.filename
+            for i in range(10):
+                log.write(2, b'motor')
+        self.assertEqual(log.stats['write_wait_2']['count'], 10)
+        self.assertGreater(log.stats['write_wait_2']['max_us'], 0)
+        os.remove(filename)
+
+    def test_follow(self):
+        for reader_class in [LogReader, MmapLogReader]:
+            with LogWriter(prefix='tmpf', note='follow', version=1) as writer:
+                filename = writer.filename
+                with reader_class(filename) as log:
+                    records = log.follow(timeout=0.1, poll=0.01)
+                    self.assertEqual(bytes(next(records)[2]), b'follow')
+                    self.assertIsNone(next(records))
+
+                    # partially written record
+                    header = writer.pack_header(timedelta(seconds=2), 3, 6)
+                    writer.f.write(header + b'sec')
+                    writer.f.flush()
+                    self.assertIsNone(next(records))
+                    writer.f.write(b'ond')
+                    writer.f.flush()
+                    self.assertEqual(bytes(next(records)[2]), b'second')
+                    self.assertIsNone(next(records))
+
+                    t = writer.write(1, b'third')
+                    self.assertEqual(next(records), (t, 1, b'third'))
+            os.remove(filename)
+
+        with CompressedLogWriter(prefix='tmpf', block_size=100) as writer:
+            compressed = writer.filename
+            with LogReader(compressed) as log:
+                log.seek(timedelta.max)
+                records = log.follow(1, timeout=0.05, poll=0.01)
+                self.assertIsNone(next(records))
+                writer.write_record(timedelta(seconds=1), 1, bytes(100))
+                writer.write_record(timedelta(seconds=2), 2, bytes(100))
+                writer.flush()  # background compression
+                self.assertEqual(next(records), (timedelta(seconds=1), 1, bytes(100)))
+                self.assertIsNone(next(records))
+        os.remove(compressed)
+
+    def test_compressed_flush_period(self):
+        with self.assertRaises(ValueError):
+            CompressedLogWriter(prefix='tmpz', version=1)
+        with CompressedLogWriter(prefix='tmpz', flush_period=0.05) as writer:
+            filename = writer.filename
+            writer.write_record(timedelta(seconds=1), 1, b'partial')
+            with LogReader(filename) as log:
+                records = log.follow(timeout=10.0, poll=0.01)
+                # written by the writer thread, no other record completes the block
+                self.assertEqual(next(records), (timedelta(seconds=1), 1, b'partial'))
+        os.remove(filename)
+
+    def test_compressed_writer_failure(self):
+        log = CompressedLogWriter(prefix='tmpz', block_size=10, max_queue=2)
+        filename = log.filename
+        f = log.f
+        log.f = FullDisk(f)
+        with self.assertRaises(OSError):
+            for i in range(100):
+                log.write(1, b'lost')  # every record completes a block
+        self.assertFalse(log.thread.is_alive())
+        with self.assertRaises(OSError):
+            log.close()
+        self.assertTrue(f.closed)
+        os.remove(filename)
+
+    def test_compressed_writer(self):
+        for compression in ['zlib', 'lzma']:
+            with CompressedLogWriter(prefix='tmpz', note='compressed', compression=compression,
+                                     block_size=1000, flush_period=3600) as log:
+                filename = log.filename
+                for i in range(100):
+                    log.write_record(timedelta(seconds=i), 1 + i % 2, bytes([i]) * 100)
+            self.assertEqual(log.stats['blocks'], 12)
+            self.assertLess(log.stats['ratio'], 0.5)
+
+            with open_log(filename) as log:
+                self.assertEqual(log.version, 2)
+                self.assertEqual(log.read()[2], b'compressed')
+                self.assertEqual(log.read(2), (timedelta(seconds=1), 2, bytes([1]) * 100))
+                log.seek(timedelta(seconds=57))
+                self.assertEqual(log.f.cached_index, 6)  # only the block with record 57
+                self.assertEqual(log.read(), (timedelta(seconds=57), 2, bytes([57]) * 100))
+                self.assertEqual(log.count(1), 50)
+                self.assertEqual([bytes(data[:1]) for __, __, data in log.iter_stream(2)][-1], b'\x63')
+                log.seek(timedelta(hours=1))
+                with self.assertRaises(LogEnd):
+                    log.read()
+                last_block = log.f.blocks[-1][0]
+
+            # log of crashed run without index
+            with open(filename, 'r+b') as f:
+                f.truncate(last_block + 30)
+            with LogReader(filename) as log:
+                self.assertEqual(len(log.f.blocks), 11)
+                self.assertEqual(log.count(), 1 + 99)
+            os.remove(filename)
+
 # vim: expandtab sw=4 ts=4
@@ -0,0 +1,30 @@
+import unittest
+
+import numpy as np
+
+from logparser import laser_points, hit_grid
+
+
+class LogParserTest(unittest.TestCase):
+    def test_laser_points(self):
+        scans = np.zeros((2, 181), dtype=np.uint16)
+        scans[0, 90] = 1000  # straight ahead
+        scans[1, 0] = 2000  # right
+        x, y = laser_points(scans, np.array([0.0, 1.0]))
+        self.assertEqual(len(x), 2)
+        self.assertAlmostEqual(x[0], 1.0)
+        self.assertAlmostEqual(y[0], 0.0)
+        self.assertAlmostEqual(x[1], 1.0)
+        self.assertAlmostEqual(y[1], -2.0)
+
+    def test_hit_grid(self):
+        scans = np.zeros((3, 181), dtype=np.uint16)
+        scans[:, 90] = 1000
+        scans[2, 180] = 9000  # out of range
+        grid, extent = hit_grid(scans, np.zeros(3), resolution=0.5, max_range=5.0, chunk=2)
+        self.assertEqual(grid.shape, (20, 20))
+        self.assertEqual(extent, (-5.0, 5.0, -5.0, 5.0))
+        self.assertEqual(grid.sum(), 3)
+        self.assertEqual(grid[10, 12], 3)
+
+# vim: expandtab sw=4 ts=4
@@ -0,0 +1,54 @@
+import unittest
+import os
+from datetime import timedelta
+
+from logger import LogWriter, LogReader
+from logslice import *
+
+
+class LogSliceTest(unittest.TestCase):
+
+    def test_slice(self):
+        with LogWriter(prefix='tmps', version=1) as log:
+            filename = log.filename
+            for i in range(100):
+                dt = timedelta(seconds=i)
+                if i in (10, 40, 70):
+                    log.write_record(dt, ANNOT_STREAM, b'TAG:turn:BEGIN')
+                if i == 20:
+                    log.write_record(dt, ANNOT_STREAM, b'TAG:enter:BEGIN')
+                if i in (15, 45):
+                    log.write_record(dt, ANNOT_STREAM, b'TAG:turn:END')
+                if i == 30:
+                    log.write_record(dt, ANNOT_STREAM, b'TAG:enter:END')
+                log.write_record(dt, 1, bytes([i]))
+                log.write_record(dt, 2, bytes([i, i]))
+
+        with LogReader(filename) as log:
+            self.assertEqual(segments(log), [
+                ('turn', timedelta(seconds=10), timedelta(seconds=15)),
+                ('enter', timedelta(seconds=20), timedelta(seconds=30)),
+                ('turn', timedelta(seconds=40), timedelta(seconds=45)),
+                ('turn', timedelta(seconds=70), None)])
+            start, end = find_segment(log, 'turn', 1)
+            start_time = log.start_time
+            sliced = slice_log(log, start, end, prefix='tmpss')
+            with self.assertRaises(FileExistsError):
+                slice_log(log, start, end, prefix='tmpss')  # the same start time
+            with self.assertRaises(ValueError):
+                find_segment(log, 'turn', 3)
+            with self.assertRaises(ValueError):
+                find_segment(log, 'unknown')
+
+        with LogReader(sliced) as log:
+            self.assertEqual(log.start_time, start_time + timedelta(seconds=40))
+            self.assertEqual(log.read()[0], timedelta())  # note
+            self.assertEqual(log.read(), (timedelta(), ANNOT_STREAM, b'TAG:turn:BEGIN'))
+            self.assertEqual(log.count(1), 6)
+            self.assertEqual(log.count(2), 6)
+            self.assertEqual(log.count(), 1 + 2 + 12)
+            self.assertEqual(list(log.iter_stream(2))[-1], (timedelta(seconds=5), 2, b'--'))
+        os.remove(filename)
+        os.remove(sliced)
+
+# vim: expandtab sw=4 ts=4
@@ -0,0 +1,123 @@
+import unittest
+import itertools
+import os
+import random
+import socket
+from concurrent.futures import Future
+
+from logger import LogWriter, LogReader
+from naio import naio_frame
+from myr2017 import laser2ascii, laser_sectors, free_gaps, VideoRecorder, VIDEO_STREAM, VIDEO_GAP
+
+
+def reference_laser2ascii(scan, limit = 1.0):
+    "original pure Python version"
+    step = 5
+    scan2 = [x == 0 and 10000 or x for x in scan]
+    min_dist_arr = [min(i)/1000.0 for i in
+                        [itertools.islice(scan2, start, start + step)
+                            for start in range(0, len(scan2), step)]]
+    s = ''
+    for d in min_dist_arr:
+        s += (d < 0.5 and 'X' or (d<1.0 and 'x' or (d<1.5 and '.' or ' ')))
+    mid = int(len(s)/2)
+    s = s[:mid] + 'C' + s[mid:]
+
+    left, right = mid, mid
+    while left > 0 and min_dist_arr[left] > limit:
+        left -= 1
+    while right < len(min_dist_arr) and min_dist_arr[right] > limit:
+        right += 1
+
+    return s, mid-left, right-mid
+
+
+class LaserTest(unittest.TestCase):
+
+    def test_laser2ascii(self):
+        rand = random.Random(1)
+        scans = [[0] * 181, [500] * 181, [1000] * 181]
+        for i in range(200):
+            scans.append([rand.choice([0, rand.randint(100, 3000)]) for j in range(181)])
+        for scan in scans:
+            for limit in [1.0, 1.5]:
+                self.assertEqual(laser2ascii(scan, limit), reference_laser2ascii(scan, limit))
+
+    def test_free_gaps(self):
+        scan = [2000] * 181
+        scan[0] = 900
+        scan[170] = 1200
+        sectors = laser_sectors(scan)
+        self.assertEqual(free_gaps(sectors, [1.0, 1.5]), [(18, 19), (18, 16)])
+
+
+class SlowPool:
+    "compression pool which falls behind until released"
+    def __init__(self):
+        self.tasks = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.tasks.append((future, fn, args))
+        return future
+
+    def release(self):
+        for future, fn, args in self.tasks:
+            if future.set_running_or_notify_cancel():
+                future.set_result(fn(*args))
+
+    def shutdown(self):
+        pass
+
+
+class VideoRecorderTest(unittest.TestCase):
+
+    def test_backlog(self):
+        with LogWriter(prefix='tmpv', version=1) as log:
+            filename = log.filename
+            recorder = VideoRecorder(None, log)
+            recorder.pool = SlowPool()
+            frames = naio_frame(0x20, bytes(1000)) + naio_frame(0x20, bytes(2000))
+            for i in range(20):
+                recorder.submit(frames)
+            levels = [args[1] for __, __, args in recorder.pool.tasks]
+            self.assertEqual(levels, [7, 7, 3, 3, 1, 1, 1, 1] + [0] * 12)
+            recorder.pool.release()
+            recorder.writer.start()
+            recorder.pending.put(None)
+            recorder.writer.join()
+        stats = recorder.stats
+        self.assertEqual(stats['chunks_received'], 20)
+        self.assertEqual(stats['chunks_dropped'], 4)  # the oldest over backlog limit 16
+        self.assertEqual(stats['chunks_compressed'], 4)
+        self.assertEqual(stats['chunks_stored'], 12)
+        self.assertEqual(stats['frames_received'], 40)
+        self.assertEqual(stats['frames_compressed'], 8)
+        self.assertEqual(stats['frames_stored'], 24)
+        self.assertEqual(stats['max_backlog'], 16)
+        with LogReader(filename) as log:
+            self.assertEqual(log.count(VIDEO_STREAM), 1 + 16)
+            self.assertEqual(log.read(VIDEO_STREAM)[2], VIDEO_GAP)  # in place of 4 dropped chunks
+        os.remove(filename)
+
+    def test_log_failure(self):
+        class FullLog:
+            version = 1
+
+            def write(self, stream_id, data):
+                raise OSError('no space left')
+
+        soc, robot = socket.socketpair()
+        recorder = VideoRecorder(soc, FullLog())
+        recorder.start()
+        with robot:
+            for i in range(40):
+                robot.sendall(naio_frame(0x20, bytes(0x40000)))
+        recorder.join(timeout=10.0)
+        soc.close()
+        self.assertFalse(recorder.is_alive())  # not blocked by the dead writer
+        self.assertIsInstance(recorder.error, OSError)
+        self.assertEqual(recorder.stats['frames_received'], 40)
+        self.assertEqual(recorder.stats['frames_compressed'] + recorder.stats['frames_stored'], 0)
+
+# vim: expandtab sw=4 ts=4
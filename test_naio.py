@@ -0,0 +1,39 @@
+import unittest
+
+from naio import *
+
+
+class NaioDecoderTest(unittest.TestCase):
+
+    def test_split_frames(self):
+        data = naio_frame(0x06, b'\x01\x02\x03\x04') + naio_frame(0x0A, b'\x00' * 6)
+        decoder = NaioDecoder(check_crc=True)
+        frames = []
+        for i in range(0, len(data), 3):
+            decoder.feed(data[i:i + 3])
+            frames.extend((msg_id, bytes(payload)) for msg_id, payload in decoder.frames())
+        self.assertEqual(frames, [(0x06, b'\x01\x02\x03\x04'), (0x0A, b'\x00' * 6)])
+        self.assertEqual(len(decoder), 0)
+        self.assertEqual(decoder.num_frames, 2)
+        self.assertEqual(decoder.bad_frames, 0)
+
+    def test_resync(self):
+        good = naio_frame(0x07, b'\xAA\xBB')
+        corrupted = bytearray(naio_frame(0x07, b'\xCC\xDD'))
+        corrupted[12] ^= 0xFF
+        decoder = NaioDecoder(check_crc=True)
+        decoder.feed(b'garbage' + good + bytes(corrupted) + good)
+        self.assertEqual([bytes(payload) for __, payload in decoder.frames()],
+                         [b'\xAA\xBB', b'\xAA\xBB'])
+        self.assertEqual(decoder.bad_frames, 2)
+        self.assertEqual(decoder.skipped_bytes, len(b'garbage') + len(corrupted))
+
+    def test_referenced_payload(self):
+        decoder = NaioDecoder()
+        decoder.feed(naio_frame(0x01, b'\x70\x70'))
+        __, payload = decoder.next_frame()
+        decoder.feed(naio_frame(0x01, b'\x40\x70'))  # buffer cannot be resized in place
+        self.assertEqual(bytes(payload), b'\x70\x70')
+        self.assertEqual(bytes(decoder.next_frame()[1]), b'\x40\x70')
+
+# vim: expandtab sw=4 ts=4
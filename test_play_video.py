@@ -0,0 +1,75 @@
+import unittest
+import os
+import socket
+import tempfile
+from threading import Thread
+
+from logger import LogWriter, LogReader
+from naio import naio_frame
+from synthlog import video_image, VIDEO_ID
+from myr2017 import VideoRecorder, VIDEO_CHUNK_SIZE
+from play_video import video_frames, play_video
+
+
+class PlayVideoTest(unittest.TestCase):
+
+    def test_recorded_video(self):
+        images = [video_image(i) for i in range(3)]
+        soc, robot = socket.socketpair()
+
+        def send_video():
+            with robot:
+                for image in images:
+                    robot.sendall(naio_frame(VIDEO_ID, image))
+
+        sender = Thread(target=send_video)
+        with LogWriter(prefix='tmpv', version=1) as log:
+            filename = log.filename
+            recorder = VideoRecorder(soc, log)
+            recorder.start()
+            sender.start()
+            sender.join()
+            recorder.join()
+        soc.close()
+        self.assertEqual(recorder.stats['frames_received'], 3)
+
+        with LogReader(filename) as log:
+            frames = [bytes(image) for __, image in video_frames(log)]
+        self.assertEqual(frames, [image[5:] for image in images])
+
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as dirname:
+            os.chdir(dirname)
+            try:
+                self.assertEqual(play_video(os.path.join(cwd, filename), first=1), 2)
+                with open('image_002.pgm', 'rb') as f:
+                    self.assertEqual(f.read(), b'P5\n752 960\n255\n' + images[2][5:])
+            finally:
+                os.chdir(cwd)
+        os.remove(filename)
+
+    def test_dropped_chunk(self):
+        images = [video_image(i) for i in range(6)]
+        stream = b''.join([naio_frame(VIDEO_ID, image) for image in images])
+        with LogWriter(prefix='tmpv', version=1) as log:
+            filename = log.filename
+            recorder = VideoRecorder(None, log)
+            for i in range(0, len(stream), VIDEO_CHUNK_SIZE):
+                recorder.submit(stream[i:i + VIDEO_CHUNK_SIZE])
+            items = []
+            while not recorder.pending.empty():
+                items.append(recorder.pending.get())
+            for index, item in enumerate(items):
+                if index != 3:  # dropped in the middle of image 2
+                    recorder.pending.put(item)
+            recorder.writer.start()
+            recorder.pending.put(None)
+            recorder.writer.join()
+            recorder.pool.shutdown()
+
+        with LogReader(filename) as log:
+            frames = [bytes(image) for __, image in video_frames(log)]
+        self.assertEqual(frames, [images[i][5:] for i in [0, 1, 3, 4, 5]])
+        os.remove(filename)
+
+# vim: expandtab sw=4 ts=4
@@ -0,0 +1,88 @@
+import unittest
+import os
+import struct
+from datetime import timedelta
+from unittest import mock
+
+from logger import LogWriter
+from naio import naio_frame
+from robot import MOTOR_ID, LASER_ID
+from myr2017 import INPUT_STREAM, OUTPUT_STREAM
+from replay import replay
+
+
+FORWARD = bytes([0x70, 0x70])
+STOP = bytes([0, 0])
+
+
+def motor_msg(pwm):
+    "motor command as sent by WrapperIO.put()"
+    return b'NAIO01' + bytes([MOTOR_ID]) + struct.pack('>I', 2) + pwm + b'\xCD\xCD\xCD\xCD'
+
+
+def write_run(commands):
+    "log of laser scans every 0.1s each answered by motor command, return filename"
+    with LogWriter(prefix='tmpy', version=1) as log:
+        for i, pwm in enumerate(commands):
+            dt = timedelta(seconds=i / 10)
+            log.write_record(dt, INPUT_STREAM, naio_frame(LASER_ID, bytes(271 * 3)))
+            log.write_record(dt, OUTPUT_STREAM, motor_msg(pwm))
+    return log.filename
+
+
+class FakeClock:
+    "time.sleep() only moves the clock"
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+    perf_counter = monotonic
+
+    def sleep(self, delay):
+        self.now += delay
+
+
+class ReplayTest(unittest.TestCase):
+
+    def test_matching(self):
+        filename = write_run([FORWARD] * 20)
+        stats = replay(filename, test_case='1m')  # moves forward till the end of log
+        self.assertEqual(stats['cycles'], 20)
+        self.assertEqual(stats['outputs'], 20)
+        self.assertEqual(stats['match_ratio'], 1.0)
+        self.assertIsNone(stats['first_divergence'])
+        os.remove(filename)
+
+    def test_divergence(self):
+        filename = write_run([FORWARD] * 5 + [STOP] + [FORWARD] * 14)
+        with self.assertRaises(AssertionError):
+            replay(filename, test_case='1m')
+        stats = replay(filename, test_case='1m', force=True)
+        self.assertEqual(stats['outputs'], 20)
+        self.assertEqual(stats['matching'], 19)
+        self.assertEqual(stats['first_divergence'], 0.5)
+        os.remove(filename)
+
+    def test_pacing(self):
+        filename = write_run([FORWARD] * 20)
+        clock = FakeClock()
+        with mock.patch('replay.time', clock):
+            stats = replay(filename, test_case='1m', speed=10.0)
+        self.assertAlmostEqual(stats['duration'], 1.9 / 10.0)
+        self.assertAlmostEqual(stats['realtime_factor'], 10.0)
+        with self.assertRaises(ValueError):
+            replay(filename, test_case='1m', speed=0)
+        os.remove(filename)
+
+    def test_step(self):
+        filename = write_run([FORWARD] * 3)
+        with mock.patch('builtins.input', return_value='') as prompt:
+            stats = replay(filename, test_case='1m', step=True)
+        self.assertEqual(stats['cycles'], 3)
+        self.assertEqual([call[0][0] for call in prompt.call_args_list],
+                         ['0:00:00 7070 > ', '0:00:00.100000 7070 > ', '0:00:00.200000 7070 > '])
+        os.remove(filename)
+
+# vim: expandtab sw=4 ts=4
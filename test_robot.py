@@ -28,6 +28,21 @@ class RoboTest(unittest.TestCase):
         self.assertEqual(robot.odometry_right_raw, 2)
         self.assertEqual(q_out.get(), (MOTOR_ID, b'\x00\x00'))
 
+    def test_message_types(self):
+        q_in = Queue()
+        q_out = Queue()
+        robot = Robot(q_in.get, q_out.put, term=GYRO_ID)
+
+        q_in.put((None, ACCELEROMETER_ID, b'\x00\x01\xFF\xFF\x00\x02'))
+        q_in.put((None, 0x42, b'unknown'))
+        q_in.put((None, 0x42, b'unknown'))
+        q_in.put((None, GYRO_ID, b'\x00\x00\x00\x00\x01\x00'))
+        robot.update()
+        self.assertEqual(robot.accelerometer_raw, (1, -1, 2))
+        self.assertEqual(robot.gyro_raw, (0, 0, 256))
+        self.assertEqual(robot.msg_counts[0x42], 2)
+        self.assertEqual(robot.msg_counts[GYRO_ID], 1)
+
     def test_annotations(self):
         q_in = Queue()
         q_out = Queue()
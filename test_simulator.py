@@ -0,0 +1,63 @@
+import unittest
+import glob
+import os
+import socket
+import tempfile
+from threading import Thread
+
+from logger import LogReader
+from simulator import FakeRobot, synthetic_source, synthetic_video
+from synthlog import video_image
+from myr2017 import main, run_robot, VIDEO_STREAM
+from play_video import video_frames
+from replay import replay
+
+
+def fake_robot_server(source):
+    "return (port, thread) of FakeRobot serving single client, robot is thread.robot"
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+
+    def serve():
+        soc, __ = server.accept()
+        server.close()
+        with soc:
+            thread.robot.serve(soc)
+
+    thread = Thread(target=serve, daemon=True)
+    thread.robot = FakeRobot(source, speed=1.0)
+    thread.start()
+    return server.getsockname()[1], thread
+
+
+class SimulatorTest(unittest.TestCase):
+
+    def test_main(self):
+        port, robot_thread = fake_robot_server(synthetic_source(duration=1.0))
+        video_port, video_thread = fake_robot_server(synthetic_video(fps=20.0, duration=1.0))
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as dirname:
+            os.chdir(dirname)
+            try:
+                for robot in main('127.0.0.1', port, video_port):
+                    try:
+                        run_robot(robot, test_case='1m')
+                    except ConnectionError:
+                        pass  # the simulator sent everything
+                robot_thread.join()
+                video_thread.join()
+                filename, = glob.glob('naio*.log')
+
+                self.assertGreater(robot_thread.robot.commands, 0)
+                stats = replay(filename, test_case='1m')  # recorded motor commands are asserted
+                self.assertGreaterEqual(stats['outputs'], robot_thread.robot.commands)
+                self.assertEqual(stats['matching'], stats['outputs'])
+
+                with LogReader(filename) as log:
+                    images = [bytes(image) for __, image in video_frames(log)]
+                self.assertEqual(images, [video_image(i)[5:] for i in range(20)])
+            finally:
+                os.chdir(cwd)
+
+# vim: expandtab sw=4 ts=4
@@ -0,0 +1,34 @@
+import unittest
+import os
+
+import myr2017
+from synthlog import generate
+from sweep import *
+
+
+class SweepTest(unittest.TestCase):
+
+    def test_parameter_grid(self):
+        grid = parameter_grid({'NEAR_LIMIT': [0.9, 1.0], 'MAX_GAP_SIZE': [11, 13, 15]})
+        self.assertEqual(len(grid), 6)
+        self.assertEqual(grid[0], {'MAX_GAP_SIZE': 11, 'NEAR_LIMIT': 0.9})
+        self.assertEqual(parse_param('OPEN_SIZE=15,17'), ('OPEN_SIZE', [15, 17]))
+        self.assertEqual(parse_param('FAR_LIMIT=1.5'), ('FAR_LIMIT', [1.5]))
+
+    def test_replay_with(self):
+        filename = generate(prefix='tmpsw', duration=3.0)
+        row = replay_with((1, {'MAX_GAP_SIZE': 7}, filename, 'loops'))
+        self.assertEqual(myr2017.MAX_GAP_SIZE, 7)
+        set_parameters({})
+        self.assertEqual(myr2017.MAX_GAP_SIZE, DEFAULTS['MAX_GAP_SIZE'])
+        os.remove(filename)
+
+        self.assertEqual((row['combination'], row['MAX_GAP_SIZE']), (1, 7))
+        self.assertGreater(row['outputs'], 20)
+        self.assertEqual(row['matching'] == row['outputs'], row['first_divergence'] is None)
+
+        summary = summarize([row], [{'MAX_GAP_SIZE': 5}, {'MAX_GAP_SIZE': 7}])
+        self.assertEqual(summary[0]['logs'], 0)
+        self.assertEqual(summary[1]['mean_match_ratio'], row['match_ratio'])
+
+# vim: expandtab sw=4 ts=4
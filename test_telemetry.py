@@ -0,0 +1,44 @@
+import unittest
+import os
+from queue import Queue
+from datetime import timedelta
+
+from robot import Robot, LASER_ID, GYRO_ID
+try:
+    from telemetry import *
+except ImportError:
+    TelemetryPublisher = None  # multiprocessing.shared_memory requires Python 3.8
+
+
+@unittest.skipIf(TelemetryPublisher is None, 'shared memory is not available')
+class TelemetryTest(unittest.TestCase):
+
+    def test_publish(self):
+        name = 'tmp_telemetry_%d' % os.getpid()  # not blocked by segment of crashed run
+        with TelemetryPublisher(name) as publisher, TelemetryReader(name) as reader:
+            self.assertIsNone(reader.read())
+
+            q_in = Queue()
+            q_out = Queue()
+            robot = Robot(q_in.get, q_out.put, telemetry=publisher)
+            q_in.put((timedelta(seconds=1), GYRO_ID, b'\x00\x01\x00\x02\xFF\xFF'))
+            q_in.put((timedelta(seconds=2), LASER_ID, bytes(range(256)) * 2 + bytes(271 + 30)))
+            robot.move_right()
+            robot.update()
+
+            snapshot = reader.read()
+            self.assertEqual(snapshot['sequence'], 2)
+            self.assertEqual(snapshot['updates'], 1)
+            self.assertEqual(snapshot['time'], timedelta(seconds=2))
+            self.assertEqual(snapshot['gyro_raw'], (1, 2, -1))
+            self.assertEqual(snapshot['motor_pwm'], [0x70, 0x40])
+            self.assertEqual(list(snapshot['laser']), list(robot.laser))
+            self.assertEqual(snapshot['odometry_left_raw'], 0)
+
+            # torn snapshot is never returned
+            publisher.sequence += 1
+            SEQUENCE.pack_into(publisher.buf, 0, publisher.sequence)
+            with self.assertRaises(TimeoutError):
+                reader.read(retries=10)
+
+# vim: expandtab sw=4 ts=4
@@ -0,0 +1,167 @@
+import unittest
+import os
+import socket
+import time
+from threading import Thread, current_thread
+
+from logger import LogWriter, LogReader
+from naio import naio_frame
+from robot import Robot, ODOMETRY_ID
+from myr2017 import WrapperIO, AsyncWrapperIO, OUTPUT_STREAM
+from transport import AsyncTransport, VIDEO_STREAM
+
+
+class AsyncTransportTest(unittest.TestCase):
+
+    def test_robot_io(self):
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        received = []
+
+        def fake_robot():
+            soc, __ = server.accept()
+            with soc:
+                for i in range(10):
+                    soc.sendall(naio_frame(ODOMETRY_ID, bytes([i & 1, 0, 0, 0])))
+                    received.append(soc.recv(1024))
+
+        robot_thread = Thread(target=fake_robot)
+        robot_thread.start()
+        with LogWriter(prefix='tmpt') as log:
+            filename = log.filename
+            transport = AsyncTransport(log, timeout=5.0)
+            transport.start('127.0.0.1', server.getsockname()[1])
+            io = AsyncWrapperIO(transport, log)
+            robot = Robot(io.get, io.put, io.annot, term=ODOMETRY_ID)
+            live = []
+            for i in range(10):
+                robot.update()
+                live.append((robot.time, robot.odometry_right_raw))
+            robot_thread.join()
+            with self.assertRaises(ConnectionError):
+                robot.update()
+            transport.close()
+        server.close()
+        self.assertEqual(len(received), 10)
+
+        with LogReader(filename) as log:
+            self.assertEqual(log.count(OUTPUT_STREAM), 10)
+            io = WrapperIO(None, log)
+            robot = Robot(io.get, io.put, io.annot, term=ODOMETRY_ID)
+            replay = []
+            for i in range(10):
+                robot.update()
+                replay.append((robot.time, robot.odometry_right_raw))
+        self.assertEqual(live, replay)
+        os.remove(filename)
+
+    def test_replay_motor_commands(self):
+        # the robot streams faster than the control loop consumes, so several
+        # inputs are waiting in the transport while motor commands are sent
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+
+        def fake_robot():
+            soc, __ = server.accept()
+            with soc:
+                soc.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # every frame is one input
+                soc.settimeout(0.001)
+                received = 0
+                i = 0
+                while received < 40 * 17:  # till all motor commands arrive
+                    soc.sendall(naio_frame(ODOMETRY_ID, bytes([i & 1, 0, 0, 0])))
+                    i += 1
+                    try:
+                        received += len(soc.recv(1024))
+                    except socket.timeout:
+                        pass
+
+        def control(robot):
+            commands = []
+            for i in range(40):
+                robot.update()
+                if robot.odometry_right_raw % 3 == 0:
+                    robot.move_forward()
+                else:
+                    robot.stop()
+                commands.append(robot.get_motor_cmd())
+                time.sleep(0.003)
+            return commands
+
+        robot_thread = Thread(target=fake_robot)
+        robot_thread.start()
+        with LogWriter(prefix='tmpt', version=1) as log:
+            filename = log.filename
+            transport = AsyncTransport(log, timeout=5.0)
+            transport.start('127.0.0.1', server.getsockname()[1])
+            io = AsyncWrapperIO(transport, log)
+            live = control(Robot(io.get, io.put, io.annot, term=ODOMETRY_ID))
+            robot_thread.join()
+            transport.close()
+        server.close()
+
+        with LogReader(filename) as log:
+            self.assertEqual(log.count(OUTPUT_STREAM), 40)
+            io = WrapperIO(None, log)  # recorded motor commands are asserted
+            replay = control(Robot(io.get, io.put, io.annot, term=ODOMETRY_ID))
+            self.assertEqual(io.num_matching, 40)
+        self.assertEqual(live, replay)
+        os.remove(filename)
+
+    def test_video_log_failure(self):
+        servers = [socket.socket(), socket.socket()]
+        for server in servers:
+            server.bind(('127.0.0.1', 0))
+            server.listen(1)
+
+        def fake_robot():
+            soc, __ = servers[0].accept()
+            video, __ = servers[1].accept()
+            with soc, video:
+                video.sendall(naio_frame(0x20, bytes(1000)))
+                soc.recv(1)  # till the transport closes
+
+        class FullLog(LogWriter):
+            def write(self, stream_id, data):
+                if stream_id == VIDEO_STREAM:
+                    self.video_thread = current_thread()
+                    raise OSError('no space left')
+                return super().write(stream_id, data)
+
+        robot_thread = Thread(target=fake_robot)
+        robot_thread.start()
+        with FullLog(prefix='tmpt') as log:
+            filename = log.filename
+            transport = AsyncTransport(log, timeout=5.0, video_chunk_size=100)
+            transport.start('127.0.0.1', servers[0].getsockname()[1],
+                            servers[1].getsockname()[1])
+            for i in range(100):
+                if transport.output_tasks[0].done():
+                    break
+                time.sleep(0.01)
+            with self.assertRaises(OSError):
+                transport.close()
+            self.assertFalse(transport.thread.is_alive())
+            self.assertTrue(transport.loop.is_closed())
+            self.assertNotEqual(log.video_thread, transport.thread)  # not written by the loop
+        robot_thread.join()
+        for server in servers:
+            server.close()
+        os.remove(filename)
+
+    def test_start_failure(self):
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        port = server.getsockname()[1]
+        server.close()  # nobody listens
+        with LogWriter(prefix='tmpt') as log:
+            filename = log.filename
+            transport = AsyncTransport(log, timeout=5.0)
+            with self.assertRaises(OSError):
+                transport.start('127.0.0.1', port)
+            self.assertFalse(transport.thread.is_alive())
+        os.remove(filename)
+
+# vim: expandtab sw=4 ts=4
@@ -0,0 +1,170 @@
+"""
+  asyncio transport - robot socket, video socket and video logging served by
+  single event loop running in background thread
+"""
+
+import asyncio
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Empty
+from threading import Thread
+
+from compression import AdaptiveCompression
+
+
+ANNOT_STREAM = 0
+VIDEO_STREAM = 3
+VIDEO_GAP = b''  # empty video record replaces dropped chunks
+
+
+class AsyncTransport:
+    """
+    Received robot data are handed over as blocks via read_input(), the consumer
+    logs them together with its motor commands (see AsyncWrapperIO) so that
+    the log keeps the order required by replay. Sending is done by the loop,
+    annotations and video are logged by single log thread, so neither the
+    caller nor the loop waits for the disk. Failure of video logging is
+    raised by close().
+    """
+    def __init__(self, log, timeout=10.0, video_chunk_size=0x80000,
+                 compression_levels=((2, 7),), max_backlog=16, workers=2):
+        self.log = log
+        self.timeout = timeout
+        self.video_chunk_size = video_chunk_size
+        self.compression = AdaptiveCompression(compression_levels)
+        self.max_backlog = max_backlog  # chunks waiting for compression, the oldest is dropped
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(target=self.loop.run_forever, daemon=True)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.log_pool = ThreadPoolExecutor(max_workers=1)  # keeps order of log writes
+        self.inputs = Queue()
+        self.writer = None
+        self.video_writer = None
+        self.video_queue = None
+        self.input_tasks = []
+        self.output_tasks = []
+
+    def start(self, host, port, video_port=None):
+        self.thread.start()
+        try:
+            self.call(self.connect(host, port, video_port))
+        except BaseException:
+            self.close()  # do not leave the loop thread running
+            raise
+
+    def call(self, coro):
+        "run coroutine on the loop and wait for its result"
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(self.timeout)
+
+    async def connect(self, host, port, video_port):
+        reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port), self.timeout)
+        self.input_tasks.append(self.loop.create_task(self.robot_input(reader)))
+        if video_port is not None:
+            video_reader, self.video_writer = await asyncio.wait_for(
+                    asyncio.open_connection(host, video_port), self.timeout)
+            self.video_queue = asyncio.Queue(maxsize=self.max_backlog)
+            self.input_tasks.append(self.loop.create_task(self.video_input(video_reader)))
+            self.output_tasks.append(self.loop.create_task(self.video_output()))
+
+    async def robot_input(self, reader):
+        try:
+            while True:
+                data = await reader.read(1024)
+                if len(data) == 0:
+                    break
+                self.inputs.put(data)
+        finally:
+            self.inputs.put(None)  # connection closed
+
+    async def video_input(self, reader):
+        buf = bytearray()
+        try:
+            while True:
+                data = await reader.read(0x10000)
+                if len(data) == 0:
+                    break
+                buf += data
+                if len(buf) >= self.video_chunk_size:
+                    self.compress(bytes(buf))
+                    buf.clear()
+        finally:
+            if len(buf) > 0:
+                self.compress(bytes(buf))
+            self.enqueue_video(None)
+
+    def compress(self, data):
+        index = self.compression.chunks_received
+        level, num_frames = self.compression.received(data, self.video_queue.qsize())
+        future = self.loop.run_in_executor(self.pool, zlib.compress, data, level)
+        self.enqueue_video((future, level, num_frames, index))
+
+    def enqueue_video(self, item):
+        "queue item for video_output(), drop the oldest one if the queue is full"
+        if self.video_queue.full():
+            future, __, num_frames, __ = self.video_queue.get_nowait()
+            future.cancel()
+            self.compression.dropped(num_frames)
+        self.video_queue.put_nowait(item)
+
+    async def video_output(self):
+        next_index = 0
+        while True:
+            item = await self.video_queue.get()
+            if item is None:
+                break
+            future, level, num_frames, index = item
+            data = await future
+            if index != next_index:
+                await self.loop.run_in_executor(self.log_pool, self.log.write, VIDEO_STREAM, VIDEO_GAP)
+            await self.loop.run_in_executor(self.log_pool, self.log.write, VIDEO_STREAM, data)
+            self.compression.written(data, level, num_frames)
+            next_index = index + 1
+
+    def read_input(self):
+        "return next received block"
+        try:
+            data = self.inputs.get(timeout=self.timeout)
+        except Empty:
+            raise TimeoutError('no robot data for %.1fs' % self.timeout)
+        if data is None:
+            self.inputs.put(None)  # keep it closed for next call
+            raise ConnectionError('robot connection closed')
+        return data
+
+    def send(self, naio_msg):
+        self.loop.call_soon_threadsafe(self.writer.write, naio_msg)
+
+    def annot(self, annotation):
+        self.log_write(ANNOT_STREAM, annotation)
+
+    def log_write(self, stream_id, data):
+        self.log_pool.submit(self.log.write, stream_id, data)
+
+    async def shutdown(self):
+        for task in self.input_tasks:
+            task.cancel()
+        await asyncio.gather(*self.input_tasks, return_exceptions=True)
+        try:
+            await asyncio.gather(*self.output_tasks)  # remaining video is written
+        finally:
+            for writer in [self.writer, self.video_writer]:
+                if writer is not None:
+                    writer.close()
+
+    def close(self):
+        "stop the loop and the pools, failure of the video logging is raised at the end"
+        try:
+            self.call(self.shutdown())
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+            self.pool.shutdown()
+            self.log_pool.shutdown()  # pending annotations are written
+
+    @property
+    def video_stats(self):
+        return self.compression.stats(0 if self.video_queue is None else self.video_queue.qsize())
+
+# vim: expandtab sw=4 ts=4